@@ -0,0 +1,454 @@
+import os
+import sys
+import json
+import stat
+import errno
+import shutil
+import argparse
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from send2trash import send2trash
+except ImportError:
+    send2trash = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# links and deletes duplicate files by their marks, on a pool of threads, one group of duplicates at a time per thread
+# every operation is written to a journal before anything is changed, and marked done after,
+# so an apply that was interrupted can be resumed, or rolled back
+# a linked or deleted file is put back by copying a file that was kept in its group, since it had the same bytes
+# journal lines are json, the plan first, one line for each operation with an "id",
+# then {"done": id}, {"failed": id, "error": ...} or {"undone": id} as each one finishes
+# a done link op also has the "method" it used, since it can fall back to another one
+# files are never removed before they're replaced, the new link or copy is made next to the file, then renamed over it
+
+APPLY_WORKERS = 8
+FICLONE = 0x40049409  # linux ioctl to make a reflink, on btrfs, xfs and others with copy on write
+TEMP_SUFFIX = ".dup_finder_tmp"
+
+
+class FileChangedError(Exception):
+    pass
+
+
+def make_apply_op(op_name: str, group_id: int, file_path: str, file_size: int, mtime_ns: int,
+                  source_path: str = "", new_mtime_ns: int = 0) -> dict:
+    return {"op": op_name, "group": group_id, "path": file_path, "size": file_size, "mtime_ns": mtime_ns,
+            "source": source_path, "new_mtime_ns": new_mtime_ns}
+
+
+# a file is only changed if it's the same as when it was found, the size and date modified are from the scan
+def check_file(apply_op: dict) -> None:
+    file_stat = os.lstat(apply_op["path"])
+    if os.path.islink(apply_op["path"]) or file_stat.st_size != apply_op["size"] or \
+            file_stat.st_mtime_ns != apply_op["mtime_ns"]:
+        raise FileChangedError("File changed since the search: " + apply_op["path"])
+
+
+def check_source(apply_op: dict) -> None:
+    if not os.path.isfile(apply_op["source"]) or os.path.getsize(apply_op["source"]) != apply_op["size"]:
+        raise FileChangedError("File to keep changed since the search: " + apply_op["source"])
+
+
+def apply_date(apply_op: dict) -> None:
+    check_file(apply_op)
+    os.utime(apply_op["path"], ns=(apply_op["new_mtime_ns"], apply_op["new_mtime_ns"]))
+
+
+def is_date_applied(apply_op: dict) -> bool:
+    return os.path.isfile(apply_op["path"]) and os.stat(apply_op["path"]).st_mtime_ns == apply_op["new_mtime_ns"]
+
+
+def undo_date(apply_op: dict) -> None:
+    os.utime(apply_op["path"], ns=(os.stat(apply_op["path"]).st_atime_ns, apply_op["mtime_ns"]))
+
+
+def make_symlink(source_path: str, file_path: str) -> None:
+    os.symlink(source_path, file_path)
+
+
+def make_hardlink(source_path: str, file_path: str) -> None:
+    os.link(source_path, file_path)
+
+
+# a copy that shares the blocks of the source until either is changed
+def make_reflink(source_path: str, file_path: str) -> None:
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are only made on linux")
+    with open(source_path, "rb") as source_io, open(file_path, "xb") as file_io:
+        fcntl.ioctl(file_io.fileno(), FICLONE, source_io.fileno())
+
+
+# key is method name, value is (make link, methods to try next if it can't be made)
+# a hardlink can't go to another device, and a reflink needs a file system that supports it
+LINK_METHODS = {
+    "symlink": (make_symlink, ()),
+    "hardlink": (make_hardlink, ("symlink", )),
+    "reflink": (make_reflink, ("hardlink", "symlink")),
+}
+
+
+def get_temp_path(file_path: str) -> str:
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, "." + name + TEMP_SUFFIX)
+
+
+def remove_temp(temp_path: str) -> None:
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+
+
+# makes the new file at a temp path next to the file, and renames it over the file, so it's never missing
+def replace_file(file_path: str, make_file: classmethod) -> None:
+    temp_path = get_temp_path(file_path)
+    # left by an apply that was stopped
+    remove_temp(temp_path)
+    try:
+        make_file(temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        remove_temp(temp_path)
+        raise
+
+
+# returns the method the file was replaced with
+def replace_with_link(apply_op: dict, method: str) -> str:
+    check_source(apply_op)
+    check_file(apply_op)
+    file_mode = stat.S_IMODE(os.lstat(apply_op["path"]).st_mode)
+    make_link, fallback_methods = LINK_METHODS[method]
+
+    def make_file(temp_path: str) -> None:
+        make_link(apply_op["source"], temp_path)
+        if method == "reflink":
+            # a reflink is a file of its own, it keeps the mode and date modified of the file it replaces
+            os.chmod(temp_path, file_mode)
+            os.utime(temp_path, ns=(apply_op["mtime_ns"], apply_op["mtime_ns"]))
+
+    try:
+        replace_file(apply_op["path"], make_file)
+        return method
+    except OSError as F:
+        if not fallback_methods or isinstance(F, FileNotFoundError):
+            raise
+    return replace_with_link(apply_op, fallback_methods[0])
+
+
+def apply_link(apply_op: dict) -> str:
+    return replace_with_link(apply_op, "symlink")
+
+
+def apply_hardlink(apply_op: dict) -> str:
+    return replace_with_link(apply_op, "hardlink")
+
+
+def apply_reflink(apply_op: dict) -> str:
+    return replace_with_link(apply_op, "reflink")
+
+
+def is_symlink_to_source(apply_op: dict) -> bool:
+    return os.path.islink(apply_op["path"]) and os.readlink(apply_op["path"]) == apply_op["source"]
+
+
+def is_hardlink_to_source(apply_op: dict) -> bool:
+    return not os.path.islink(apply_op["path"]) and os.path.isfile(apply_op["path"]) and \
+        os.path.isfile(apply_op["source"]) and os.path.samefile(apply_op["path"], apply_op["source"])
+
+
+def is_link_applied(apply_op: dict) -> bool:
+    return is_symlink_to_source(apply_op)
+
+
+def is_hardlink_applied(apply_op: dict) -> bool:
+    return is_hardlink_to_source(apply_op) or is_symlink_to_source(apply_op)
+
+
+# a reflink looks like any other file, so it's only known to be done from the journal,
+# making it again is fine, since the file keeps its size and date modified
+def is_reflink_applied(apply_op: dict) -> bool:
+    return is_hardlink_applied(apply_op)
+
+
+def apply_delete(apply_op: dict) -> None:
+    if not os.path.lexists(apply_op["path"]):
+        return
+    check_file(apply_op)
+    if send2trash is not None:
+        send2trash(apply_op["path"])
+    else:
+        os.remove(apply_op["path"])
+
+
+def is_delete_applied(apply_op: dict) -> bool:
+    return not os.path.lexists(apply_op["path"])
+
+
+# puts back a linked or deleted file, a reflink is already a copy of its own and is left as it is
+def undo_replace(apply_op: dict) -> None:
+    if os.path.lexists(apply_op["path"]) and not is_symlink_to_source(apply_op) and \
+            not is_hardlink_to_source(apply_op):
+        return
+    if not apply_op["source"]:
+        raise FileNotFoundError("No file was kept to restore from: " + apply_op["path"])
+    check_source(apply_op)
+
+    def make_copy(temp_path: str) -> None:
+        shutil.copy2(apply_op["source"], temp_path)
+        os.utime(temp_path, ns=(apply_op["mtime_ns"], apply_op["mtime_ns"]))
+
+    replace_file(apply_op["path"], make_copy)
+
+
+# key is op name, value is (apply, is applied, undo)
+# apply is run again on resume if is applied is False, so it has to work on a half done operation
+# apply can return what it did, like the method a link was made with, it's kept in the journal
+APPLY_OPS = {
+    "date": (apply_date, is_date_applied, undo_date),
+    "link": (apply_link, is_link_applied, undo_replace),
+    "hardlink": (apply_hardlink, is_hardlink_applied, undo_replace),
+    "reflink": (apply_reflink, is_reflink_applied, undo_replace),
+    "delete": (apply_delete, is_delete_applied, undo_replace),
+}
+
+
+def add_apply_op(op_name: str, apply_func: classmethod, is_applied_func: classmethod,
+                 undo_func: classmethod) -> None:
+    APPLY_OPS[op_name] = (apply_func, is_applied_func, undo_func)
+
+
+class ApplyJournal:
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+        self.ops = []  # key is op id
+        self.done = set()
+        self.failed = {}  # key is op id, value is the error
+        self.undone = set()
+        self._journal_io = None
+        self._lock = Lock()
+
+    def load(self) -> None:
+        self.ops, self.done, self.failed, self.undone = [], set(), {}, set()
+        if not os.path.isfile(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as journal_io:
+            for line in journal_io:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line can be cut off by a crash
+                    continue
+                if "op" in entry:
+                    self.ops.append(entry)
+                elif "done" in entry:
+                    self.done.add(entry["done"])
+                    self.failed.pop(entry["done"], None)
+                elif "failed" in entry:
+                    self.failed[entry["failed"]] = entry.get("error", "")
+                elif "undone" in entry:
+                    self.undone.add(entry["undone"])
+
+    # ops that never finished, failed ones don't count, so they don't keep a new apply from starting
+    def get_unfinished(self) -> list:
+        return [apply_op for apply_op in self.ops if apply_op["id"] not in self.done and
+                apply_op["id"] not in self.failed and apply_op["id"] not in self.undone]
+
+    def start(self, apply_ops: list) -> None:
+        self.ops, self.done, self.failed, self.undone = [], set(), {}, set()
+        self._journal_io = open(self.journal_path, "w", encoding="utf-8")
+        for op_id, apply_op in enumerate(apply_ops):
+            apply_op["id"] = op_id
+            self.ops.append(apply_op)
+            self._journal_io.write(json.dumps(apply_op) + "\n")
+        self._sync()
+
+    def open(self) -> None:
+        self._journal_io = open(self.journal_path, "a", encoding="utf-8")
+
+    def add_done(self, op_id: int, method: str = None) -> None:
+        self._write({"done": op_id, "method": method} if method else {"done": op_id})
+        self.done.add(op_id)
+
+    def add_failed(self, op_id: int, error: str) -> None:
+        self._write({"failed": op_id, "error": error})
+        self.failed[op_id] = error
+
+    def add_undone(self, op_id: int) -> None:
+        self._write({"undone": op_id})
+        self.undone.add(op_id)
+
+    def close(self) -> None:
+        if self._journal_io is not None:
+            with self._lock:
+                self._sync()
+                self._journal_io.close()
+                self._journal_io = None
+
+    def _write(self, entry: dict) -> None:
+        if self._journal_io is None:
+            return
+        with self._lock:
+            self._journal_io.write(json.dumps(entry) + "\n")
+            self._journal_io.flush()
+
+    def _sync(self) -> None:
+        self._journal_io.flush()
+        os.fsync(self._journal_io.fileno())
+
+
+# without a journal path, nothing is written and an apply can't be resumed or rolled back
+class ApplyEngine:
+    def __init__(self, journal_path: str = "", workers: int = APPLY_WORKERS):
+        self.journal = ApplyJournal(journal_path) if journal_path else None
+        self.workers = max(workers, 1)
+        self.ops_done = 0
+        self.ops_failed = 0
+        self._op_callback = None
+        self._count_lock = Lock()
+        self._stopping = False
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    def set_op_callback(self, callback: classmethod) -> None:
+        self._op_callback = callback
+
+    def _run_op_callback(self, apply_op: dict) -> None:
+        if self._op_callback is not None:
+            self._op_callback(apply_op)
+
+    # returns False if it didn't start, because the journal has an apply that never finished
+    def run(self, apply_ops: list) -> bool:
+        if self.journal is not None:
+            self.journal.load()
+            if self.journal.get_unfinished():
+                print("Journal has an unfinished apply, resume or roll it back first: " + self.journal.journal_path)
+                return False
+            self.journal.start(apply_ops)
+        else:
+            for op_id, apply_op in enumerate(apply_ops):
+                apply_op["id"] = op_id
+        self._run_groups(apply_ops, self._apply_op)
+        return True
+
+    def resume(self) -> bool:
+        if not self._load_journal():
+            return False
+        apply_ops = [apply_op for apply_op in self.journal.ops
+                     if apply_op["id"] not in self.journal.done and apply_op["id"] not in self.journal.undone]
+        self.journal.open()
+        self._run_groups(apply_ops, self._apply_op)
+        return True
+
+    # undoes every op that was done, newest first in each group
+    def rollback(self) -> bool:
+        if not self._load_journal():
+            return False
+        apply_ops = [apply_op for apply_op in reversed(self.journal.ops) if apply_op["id"] not in self.journal.undone]
+        self.journal.open()
+        self._run_groups(apply_ops, self._undo_op)
+        return True
+
+    def _load_journal(self) -> bool:
+        if self.journal is None or not os.path.isfile(self.journal.journal_path):
+            print("No apply journal to load")
+            return False
+        self.journal.load()
+        return True
+
+    # ops of the same group stay in order on the same thread, since later ones can depend on the file kept
+    def _run_groups(self, apply_ops: list, run_op: classmethod) -> None:
+        group_ops = {}
+        for apply_op in apply_ops:
+            group_ops.setdefault(apply_op["group"], []).append(apply_op)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                try:
+                    for _ in executor.map(lambda op_list: self._run_group(op_list, run_op), group_ops.values()):
+                        pass
+                except KeyboardInterrupt:
+                    # the executor waits on its threads before this gets out, so they have to stop first
+                    self.stop()
+                    raise
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+
+    def _run_group(self, apply_ops: list, run_op: classmethod) -> None:
+        for apply_op in apply_ops:
+            if self._stopping:
+                return
+            run_op(apply_op)
+
+    def _apply_op(self, apply_op: dict) -> None:
+        apply_func, is_applied_func, _ = APPLY_OPS[apply_op["op"]]
+        method = None
+        try:
+            if not is_applied_func(apply_op):
+                method = apply_func(apply_op)
+        except Exception as F:
+            self._add_failed(apply_op, F)
+            return
+        self._add_done(apply_op, method)
+
+    def _undo_op(self, apply_op: dict) -> None:
+        _, is_applied_func, undo_func = APPLY_OPS[apply_op["op"]]
+        # a date op only counts as applied if its date is still the new one, a link or delete has to be checked
+        # even if it isn't in the journal as done, it might have been stopped half way
+        try:
+            if apply_op["id"] in self.journal.done or apply_op["op"] != "date" or is_applied_func(apply_op):
+                undo_func(apply_op)
+        except Exception as F:
+            self._add_failed(apply_op, F)
+            return
+        self.journal.add_undone(apply_op["id"])
+        with self._count_lock:
+            self.ops_done += 1
+        self._run_op_callback(apply_op)
+
+    def _add_done(self, apply_op: dict, method: str = None) -> None:
+        if self.journal is not None:
+            self.journal.add_done(apply_op["id"], method)
+        with self._count_lock:
+            self.ops_done += 1
+        self._run_op_callback(apply_op)
+
+    def _add_failed(self, apply_op: dict, error: Exception) -> None:
+        print("Unable to " + apply_op["op"] + " file: " + apply_op["path"] + "\n" + str(error))
+        if self.journal is not None:
+            self.journal.add_failed(apply_op["id"], str(error))
+        with self._count_lock:
+            self.ops_failed += 1
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("journal", help="journal file written by an apply")
+    arg_parser.add_argument("--rollback", action="store_true",
+                            help="put back every file the apply changed, instead of finishing it")
+    arg_parser.add_argument("--workers", '-w', default=APPLY_WORKERS, type=int,
+                            help="how many groups of duplicates to work on at the same time")
+    return arg_parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    apply_engine = ApplyEngine(args.journal, args.workers)
+    try:
+        if args.rollback:
+            finished = apply_engine.rollback()
+        else:
+            finished = apply_engine.resume()
+    except KeyboardInterrupt:
+        return 130
+    print(("Rolled back: " if args.rollback else "Applied: ") + str(apply_engine.ops_done) +
+          ", failed: " + str(apply_engine.ops_failed))
+    return 0 if finished and not apply_engine.ops_failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
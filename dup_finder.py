@@ -1,22 +1,44 @@
 import os
 import sys
+import json
+import argparse
+import queue
+import asyncio
+import mmap
 import hashlib
 import datetime
+from heapq import heappush, heappop
+from collections import deque
+from contextlib import ExitStack
+from time import perf_counter, monotonic
+from array import array
 from enum import Enum, auto
-from threading import Thread
+from threading import Thread, Lock, Condition, local
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from hash_cache import HashCache, get_file_key
+from apply_engine import ApplyEngine, APPLY_WORKERS, make_apply_op
+from similarity import ChunkIndex, CHUNK_AVG_SIZE, chunk_file
+from image_hash import BKTree, IMAGE_BATCH_SIZE, IMAGE_EXTS, IMAGE_HASH_SIZES, DEFAULT_IMAGE_HASH, \
+    DEFAULT_IMAGE_DISTANCE, can_hash_images, is_image_path, hash_images
 
 try:
     from send2trash import send2trash
 except ImportError:
     print("WARNING: send2trash module not installed, "
-          "files will be deleted instead of moved to the recycle bin")
+          "files will be deleted instead of moved to the recycle bin", file=sys.stderr)
 
-# ideas
-#  - test by similarity amount
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 
 # Specify how many bytes of the file you want to open at a time
-BLOCKSIZE = 65536
+BLOCKSIZE = 1048576
+# files at least this big are mapped into memory to hash them, instead of being read into a buffer
+MMAP_MIN_SIZE = 64 * 1048576
+# how many bytes from the start and end of a file are used for the partial hash
+PARTIAL_BLOCKSIZE = 4096
 
 
 class FileMarks(Enum):
@@ -24,23 +46,427 @@ class FileMarks(Enum):
     LINK = auto(),
     DELETE = auto(),  # moves to recycle bin on windows, linux, idk, trash?
     IGNORE = auto(),
+    HARDLINK = auto(),  # falls back to a system link on another device, or a file system without them
+    REFLINK = auto(),  # a copy that shares blocks with the master, falls back to a hardlink, then a system link
+
+
+FILE_MARK_LIST = list(FileMarks)
+
+# key is the name, value makes a new hash object with update() and hexdigest()
+# the process hash backend only gets the name, so one added with add_hash_algorithm needs processes that fork
+HASH_ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": lambda: hashlib.blake2b(digest_size=32),
+}
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3"] = xxhash.xxh3_128
+# xxh3 isn't made to be safe from files made to collide on purpose, use --verify or sha256 if that matters
+DEFAULT_HASH_ALGORITHM = "xxh3" if xxhash is not None else "blake2b"
+FALLBACK_HASH_ALGORITHM = "blake2b"
+# files with these marks won't take up their own space after apply
+SPACE_SAVING_MARKS = (FileMarks.LINK, FileMarks.DELETE, FileMarks.HARDLINK, FileMarks.REFLINK)
+# first item of the group key of images that look the same, the key is (IMAGE_GROUP, hash of the first image, file id)
+IMAGE_GROUP = "image"
+# marks that replace the file with a link to the master, value is the apply op
+LINK_MARK_OPS = {FileMarks.LINK: "link", FileMarks.HARDLINK: "hardlink", FileMarks.REFLINK: "reflink"}
 
 
+# a view of one file in a FileRegistry, these are made whenever they are needed and hold nothing themselves
 class File:
-    def __init__(self, file_path: str, file_mark: Enum = FileMarks.IGNORE):
-        self.path = file_path
-        self.link = os.path.islink(file_path)
-        if file_mark not in FileMarks:
-            raise Exception("File mark not in FileMarks Enum class: " + str(file_mark))
-        self._mark = file_mark
-        
+    __slots__ = ("_registry", "file_id")
+
+    def __init__(self, registry, file_id: int):
+        self._registry = registry
+        self.file_id = file_id
+
+    @property
+    def path(self) -> str:
+        return self._registry.get_path(self.file_id)
+
+    @property
+    def link(self) -> bool:
+        return bool(self._registry.links[self.file_id])
+
     # could pick a better name
     def set_mark(self, mark: Enum) -> None:
         if mark in FileMarks:
-            self._mark = mark
+            self._registry.set_mark(self.file_id, mark)
         
     def get_mark(self) -> Enum:
-        return self._mark
+        return self._registry.get_mark(self.file_id)
+
+
+# every file found, stored by an integer file id instead of by path,
+# paths are split into a shared directory and the file name, so the full path is only built when asked for
+# works like a dict of file path to File, so it can be used as found_file_objs
+class FileRegistry:
+    def __init__(self):
+        self._dir_paths = []  # key is directory id
+        self._dir_ids = {}  # key is directory path
+        self._name_index = []  # key is directory id, value is a dict of file name to file id
+        self._dir_of = array("L")  # key is file id
+        self._names = []
+        self._order = None  # file ids sorted by path once the search is finished
+        self.sizes = array("q")
+        self.mtimes = array("q")  # date modified in nanoseconds
+        self.devices = array("Q")
+        self.inodes = array("Q")
+        self.marks = array("b")  # index in FILE_MARK_LIST
+        self.links = bytearray()
+        self.hardlinked = bytearray()  # other paths are linked to the same file, so changing this one frees nothing
+        self.partial_hashes = []
+        self.full_hashes = []
+        self._mark_callback = None
+        self._lock = Lock()
+
+    # file key is (device, inode, size, mtime_ns), link count is how many hardlinks the file has
+    def add(self, directory: str, name: str, link: bool, file_key: tuple, link_count: int = 1) -> int:
+        with self._lock:
+            dir_id = self._dir_ids.get(directory)
+            if dir_id is None:
+                dir_id = len(self._dir_paths)
+                # so paths given with a trailing separator still split back into the same directory
+                self._dir_paths.append(os.path.dirname(os.path.join(directory, name)))
+                self._dir_ids[directory] = dir_id
+                self._dir_ids[self._dir_paths[dir_id]] = dir_id
+                self._name_index.append({})
+            file_id = len(self._names)
+            self._name_index[dir_id][name] = file_id
+            self._dir_of.append(dir_id)
+            self._names.append(name)
+            self.devices.append(file_key[0])
+            self.inodes.append(file_key[1])
+            self.sizes.append(file_key[2])
+            self.mtimes.append(file_key[3])
+            self.marks.append(FILE_MARK_LIST.index(FileMarks.IGNORE))
+            self.links.append(link)
+            self.hardlinked.append(link_count > 1)
+            self.partial_hashes.append("")
+            self.full_hashes.append("")
+            self._order = None
+            return file_id
+
+    # returns -1 if the file wasn't found
+    def get_id(self, file_path: str) -> int:
+        directory, name = os.path.split(file_path)
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            return -1
+        return self._name_index[dir_id].get(name, -1)
+
+    def get_path(self, file_id: int) -> str:
+        return os.path.join(self._dir_paths[self._dir_of[file_id]], self._names[file_id])
+
+    def get_key(self, file_id: int) -> tuple:
+        return self.devices[file_id], self.inodes[file_id], self.sizes[file_id], self.mtimes[file_id]
+
+    # key is file name, value is file id
+    def get_directory_files(self, directory: str) -> dict:
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            return {}
+        return self._name_index[dir_id]
+
+    def get_file(self, file_id: int) -> File:
+        return File(self, file_id)
+
+    def get_mark(self, file_id: int) -> Enum:
+        return FILE_MARK_LIST[self.marks[file_id]]
+
+    # the mark callback sets the mark itself, so it can keep anything counted by mark in sync
+    def set_mark(self, file_id: int, mark: Enum) -> None:
+        if self._mark_callback is not None:
+            self._mark_callback(file_id, mark)
+        else:
+            self.marks[file_id] = FILE_MARK_LIST.index(mark)
+
+    def set_mark_callback(self, callback: classmethod) -> None:
+        self._mark_callback = callback
+
+    def get_ids(self):
+        return self._order if self._order is not None else range(len(self._names))
+
+    # the search workers add files in whatever order they finish directories in
+    def sort(self) -> None:
+        with self._lock:
+            self._order = array("L", sorted(range(len(self._names)),
+                                            key=lambda file_id: (self._dir_paths[self._dir_of[file_id]],
+                                                                 self._names[file_id])))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, file_path: str) -> bool:
+        return self.get_id(file_path) != -1
+
+    def __getitem__(self, file_path: str) -> File:
+        file_id = self.get_id(file_path)
+        if file_id == -1:
+            raise KeyError(file_path)
+        return File(self, file_id)
+
+    def __iter__(self):
+        for file_id in self.get_ids():
+            yield self.get_path(file_id)
+
+    def get(self, file_path: str, default=None) -> File:
+        file_id = self.get_id(file_path)
+        return File(self, file_id) if file_id != -1 else default
+
+
+# the paths of every file in a FileRegistry, for found_file_list
+class FilePathList:
+    __slots__ = ("_registry", )
+
+    def __init__(self, registry: FileRegistry):
+        self._registry = registry
+
+    def __len__(self) -> int:
+        return len(self._registry)
+
+    def __getitem__(self, index: int) -> str:
+        return self._registry.get_path(self._registry.get_ids()[index])
+
+    def __iter__(self):
+        return iter(self._registry)
+
+    def __contains__(self, file_path: str) -> bool:
+        return file_path in self._registry
+
+
+# directories waiting to be searched, shared by all the search workers
+class DirectoryQueue:
+    def __init__(self, directory_list: list):
+        self._queue = queue.Queue()
+        self._pending = 0  # directories put in the queue that haven't been marked done yet
+        self._done = Condition()
+        for directory in directory_list:
+            self.put(directory)
+
+    def put(self, directory) -> None:
+        with self._done:
+            self._pending += 1
+        self._queue.put(directory)
+
+    # returns None when the search is finished
+    def get(self) -> str:
+        return self._queue.get()
+
+    def task_done(self) -> None:
+        with self._done:
+            self._pending -= 1
+            if self._pending == 0:
+                self._done.notify_all()
+
+    def wait(self, timeout: float) -> bool:
+        with self._done:
+            if self._pending:
+                self._done.wait(timeout)
+            return self._pending == 0
+
+    def finish(self, worker_count: int) -> None:
+        for _ in range(worker_count):
+            self._queue.put(None)
+
+
+# hash jobs are kept apart by the device the file is on, and each device only has up to its limit of jobs running,
+# so a spinning disk can be read one file at a time while an ssd next to it still gets every worker
+# jobs on a device are taken in inode order, which is usually close to the order of the files on the disk
+# each device has its own maxsize, so a slow disk with a full queue only holds up puts of its own jobs
+class DeviceQueue:
+    def __init__(self, maxsize: int, get_job_key: classmethod, get_device_limit: classmethod):
+        self._get_job_key = get_job_key  # returns (device, inode) for a job
+        self._get_device_limit = get_device_limit
+        self._maxsize = maxsize  # jobs waiting on each device
+        self._device_jobs = {}  # key is device, value is a heap of (inode, job index, job)
+        self._device_running = {}  # key is device, value is how many of its jobs are running
+        self._device_limits = {}
+        self._devices = []  # the order devices are checked in, moved along after every job so no device waits forever
+        self._next_device = 0
+        self._job_index = 0  # so jobs with the same inode keep their order
+        self._size = 0
+        self._finished = False
+        self._condition = Condition()
+
+    # raises queue.Full if there's no room on the job's device before the timeout, like queue.Queue
+    def put(self, job, timeout: float = None) -> None:
+        device, inode = self._get_job_key(job)
+        with self._condition:
+            device_jobs = self._device_jobs.get(device)
+            if device_jobs is None:
+                device_jobs = self._device_jobs[device] = []
+                self._device_running[device] = 0
+                self._device_limits[device] = max(self._get_device_limit(device), 1)
+                self._devices.append(device)
+            if not self._condition.wait_for(lambda: len(device_jobs) < self._maxsize, timeout):
+                raise queue.Full
+            heappush(device_jobs, (inode, self._job_index, job))
+            self._job_index += 1
+            self._size += 1
+            self._condition.notify_all()
+
+    # returns None once finish was called and every job was taken, raises queue.Empty on timeout
+    # task_done has to be called with the job after it's done
+    def get(self, timeout: float = None):
+        end_time = None if timeout is None else monotonic() + timeout
+        with self._condition:
+            while True:
+                job = self._take_job()
+                if job is not None:
+                    return job
+                if self._finished and self._size == 0:
+                    return None
+                wait_time = None if end_time is None else end_time - monotonic()
+                if wait_time is not None and wait_time <= 0:
+                    raise queue.Empty
+                self._condition.wait(wait_time)
+
+    def task_done(self, job) -> None:
+        device = self._get_job_key(job)[0]
+        with self._condition:
+            self._device_running[device] -= 1
+            self._condition.notify_all()
+
+    def finish(self) -> None:
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    # needs self._condition held
+    def _take_job(self):
+        for index in range(len(self._devices)):
+            device = self._devices[(self._next_device + index) % len(self._devices)]
+            device_jobs = self._device_jobs[device]
+            if device_jobs and self._device_running[device] < self._device_limits[device]:
+                self._next_device = (self._next_device + index + 1) % len(self._devices)
+                self._device_running[device] += 1
+                self._size -= 1
+                self._condition.notify_all()
+                return heappop(device_jobs)[2]
+        return None
+
+
+# duplicate groups by id, with the group of any file and the group of any content hash found without a search
+# only groups with at least 2 files are kept
+# the sizes are kept up to date as files join or leave a group or their mark changes:
+# total_size is every file in a group, space_saved is the files marked to be linked or deleted,
+# unless they have other hardlinks
+# files in image groups can't be marked to be linked, they are set to ignore instead
+class DuplicateGroups:
+    def __init__(self, registry: FileRegistry):
+        self._registry = registry
+        self._groups = {}  # key is group id, value is list of file ids
+        self._group_keys = {}  # key is group id, value is the group key
+        self._group_of = {}  # key is file id, value is group id
+        self._key_groups = {}  # key is (file size, hash), value is group id
+        self._next_group_id = 0
+        self.file_count = 0
+        self.total_size = 0
+        self.space_saved = 0
+        self._lock = Lock()
+        registry.set_mark_callback(self._set_mark)
+
+    @property
+    def new_size(self) -> int:
+        return self.total_size - self.space_saved
+
+    def _count_file(self, file_id: int, direction: int) -> None:
+        file_size = self._registry.sizes[file_id] * direction
+        self.file_count += direction
+        self.total_size += file_size
+        if self._is_saving(file_id, self._registry.get_mark(file_id)):
+            self.space_saved += file_size
+
+    # the bytes of a file with other hardlinks are still kept by them after it's linked or deleted
+    def _is_saving(self, file_id: int, mark: Enum) -> bool:
+        return mark in SPACE_SAVING_MARKS and not self._registry.hardlinked[file_id]
+
+    def _set_mark(self, file_id: int, mark: Enum) -> None:
+        with self._lock:
+            group_id = self._group_of.get(file_id)
+            # images that only look the same are never linked on apply, so they can't be marked to be
+            if mark in LINK_MARK_OPS and group_id is not None and self._group_keys[group_id][0] == IMAGE_GROUP:
+                mark = FileMarks.IGNORE
+            if group_id is not None:
+                was_saving = self._is_saving(file_id, self._registry.get_mark(file_id))
+                if was_saving != self._is_saving(file_id, mark):
+                    file_size = self._registry.sizes[file_id]
+                    self.space_saved += -file_size if was_saving else file_size
+            self._registry.marks[file_id] = FILE_MARK_LIST.index(mark)
+
+    # returns the group id the files were added to
+    def add(self, group_key, file_id_list: list) -> int:
+        with self._lock:
+            return self._add(group_key, file_id_list)
+
+    def _add(self, group_key, file_id_list: list) -> int:
+        group_id = self._key_groups.get(group_key)
+        if group_id is None:
+            group_id = self._next_group_id
+            self._next_group_id += 1
+            self._groups[group_id] = []
+            self._group_keys[group_id] = group_key
+            self._key_groups[group_key] = group_id
+        for file_id in file_id_list:
+            if file_id not in self._group_of:
+                self._groups[group_id].append(file_id)
+                self._group_of[file_id] = group_id
+                self._count_file(file_id, 1)
+        return group_id
+
+    # removes the whole group if there's only 1 file left in it, returns the group id the file was in
+    def remove(self, file_id: int) -> int:
+        with self._lock:
+            return self._remove(file_id)
+
+    def _remove(self, file_id: int) -> int:
+        group_id = self._group_of.pop(file_id, None)
+        if group_id is None:
+            return -1
+        group = self._groups[group_id]
+        group.remove(file_id)
+        self._count_file(file_id, -1)
+        if len(group) < 2:
+            for last_file_id in group:
+                del self._group_of[last_file_id]
+                self._count_file(last_file_id, -1)
+            del self._groups[group_id]
+            del self._key_groups[self._group_keys.pop(group_id)]
+        return group_id
+
+    def set_group_key(self, group_id: int, group_key) -> None:
+        with self._lock:
+            old_group_key = self._group_keys.get(group_id)
+            if old_group_key is None:
+                return
+            del self._key_groups[old_group_key]
+            self._key_groups[group_key] = group_id
+            self._group_keys[group_id] = group_key
+
+    # returns -1 if the file isn't a duplicate
+    def get_group_id(self, file_id: int) -> int:
+        return self._group_of.get(file_id, -1)
+
+    def get_group(self, group_id: int) -> list:
+        return self._groups.get(group_id, [])
+
+    def get_group_key(self, group_id: int):
+        return self._group_keys.get(group_id)
+
+    def get_paths(self, group_id: int) -> list:
+        return [self._registry.get_path(file_id) for file_id in self.get_group(group_id)]
+
+    def get_path_lists(self) -> list:
+        return [self.get_paths(group_id) for group_id in list(self._groups)]
+
+    def get_group_ids(self) -> list:
+        return list(self._groups)
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def __contains__(self, group_id: int) -> bool:
+        return group_id in self._groups
 
 
 class DuplicateFinder:
@@ -49,56 +475,202 @@ class DuplicateFinder:
         self.exclude_directory_list = []
         self.exclude_ext_list = []
         self.ext_list = []
-        self.duplicate_files = []
-        self.found_file_list = []
-        self.file_size_dict = {}
-        self.file_hash_dict = {}
+        self.files = FileRegistry()
+        self.dup_groups = DuplicateGroups(self.files)
+        # each stage splits the groups of the stage before it, only groups with more than 1 file move on
+        self.file_size_groups = {}  # key is file size, value is list of file ids with that size
+        self.partial_hash_groups = {}  # key is (file size, partial hash)
+        self.full_hash_groups = {}  # key is (file size, hash)
+        # key is (file size, partial hash), value is lists of file ids with the same bytes, or None once hashed
+        self.compare_groups = {}
+        self._compare_locks = {}  # key is (file size, partial hash), so each group is compared by 1 thread at a time
+        self.compare_max_files = 3  # files with the same partial hash that are compared instead of hashed
+        self.compare_min_size = 1048576  # smaller files are always hashed
+        self.bytes_read = 0
+        self.hash_algorithm = DEFAULT_HASH_ALGORITHM
+        self.read_blocksize = BLOCKSIZE  # bytes read or hashed at a time for full hashes and verifying
+        self.verify_bytes = False  # compare files byte by byte before adding them to a duplicate group
+        self.cache_path = ""
+        self.cache_max_age = 30.0  # days a cache entry is kept without being seen in a scan
+        self.hash_cache = None
+        # only files with more than 1 link to them are kept here
+        self.inode_dict = {}  # key is (device, inode), value is the first file id found for it, the only one hashed
+        self.hardlink_groups = {}  # key is (device, inode), value is every file id found for it
+        self.hardlink_size = 0  # bytes that would be counted again for every extra path to the same file
+        # files that share this percent of their bytes or more are found after the search, see similarity
+        self.similar_min_percent = 0.0  # 0 to not look for them
+        self.similar_min_size = 1048576  # smaller files aren't checked
+        self.chunk_avg_size = CHUNK_AVG_SIZE
+        self.similar_files = []  # (file path, file path, shared bytes, similarity), most similar first
+        # images found are grouped by how they look instead of by their bytes, see image_hash
+        self.image_mode = False
+        self.image_hash = DEFAULT_IMAGE_HASH
+        self.image_distance = DEFAULT_IMAGE_DISTANCE  # bits the perceptual hashes can be apart
+        self._image_file_ids = []
+        self._image_exts = IMAGE_EXTS  # the files found with --ext if it was given
+        self.snapshot_path = ""  # json file the search is saved to, for the next incremental search
+        self.incremental = False  # only list directories that changed since the snapshot was saved
+        # key is directory, value is (mtime_ns, sub directories, (file name, is link) of each file)
+        # each one is taken out once its directory is searched
+        self._snapshot_directories = {}
+        # key is directory, value is (mtime_ns, sub directories), the files in them are taken from self.files on save
+        self._visited_directories = {}
+        # key is file path, value is [file key, partial hash, full hash], each one is taken out once its file is found
+        self._snapshot_hashes = {}
+        self.search_workers = 8  # directories searched at the same time, these mostly wait on the file system
+        self.hash_workers = os.cpu_count() or 4
+        self.hash_backend = "thread"  # "thread" or "process"
+        self.hash_queue_size = 1024  # files waiting to be hashed on a device before the directory search waits on them
+        # files hashed at the same time on each device, the device type is only found on linux, others count as ssd
+        self.hdd_workers = 1
+        self.ssd_workers = 0  # 0 for every hash worker
+        self.device_workers = {}  # key is a path, value is the workers for the device it's on, over the ones above
+        self._device_limits = {}  # key is device, from device_workers
+        self._hash_queue = None
+        self._hash_executor = None
+        self._lock = Lock()
         self.total_file_count = 0
+        self.count_files_first = False  # walk every directory once before searching to get an exact file count
+        self.file_count_estimate = 0  # file count from the last finished search, used until the count goes over it
+        self.bytes_to_hash = 0
+        self.bytes_hashed = 0
         self._files_scanned = 0
-        self.total_size = 0
-        self.space_saved = 0
-        self.new_size = 0
+        # new and changed duplicate groups are sent to the dup batch callback together,
+        # once the interval has passed or the batch is big enough, instead of once for every duplicate found
+        self.dup_batch_interval = 0.25  # seconds
+        self.dup_batch_size = 1000  # groups
+        self._dup_batch = {}  # key is group id, value is unused, only kept in the order the groups changed
+        self._dup_batch_time = 0.0
+        self._dup_batch_lock = Lock()
+        # the file scanned, total files and hash progress callbacks are called at most once an interval each,
+        # the last values are always sent when the search finishes
+        self.progress_interval = 0.1  # seconds
+        self._progress_times = {}  # key is the callback, value is when it was last called
+        self._progress_lock = Lock()
         self.ignore_links = True
         self.use_oldest_mod_date = True
+        self.apply_workers = APPLY_WORKERS  # groups of duplicates linked or deleted at the same time
+        self.apply_journal_path = ""  # json lines file to resume or roll back an apply with, see apply_engine
+        self.verify_before_apply = True  # check every duplicate against the search before apply changes anything
+        self._apply_engine = None
 
-        self.found_file_objs = {}
         # self.master_file_dict = {}  # key is master file, value is list of sys links
         
         self._file_scanned_callback = None
+        self._total_files_callback = None
+        self._hash_progress_callback = None
         self._dup_found_callback = None
+        self._dup_batch_callback = None
         self._scan_finished_callback = None
         self._apply_callback = None
         self._stopping = False
 
     def stop(self) -> None:
         self._stopping = True
+        apply_engine = self._apply_engine
+        if apply_engine is not None:
+            apply_engine.stop()
+
+    @property
+    def found_file_objs(self) -> FileRegistry:
+        return self.files
+
+    @property
+    def found_file_list(self) -> FilePathList:
+        return FilePathList(self.files)
+
+    @property
+    def total_size(self) -> int:
+        return self.dup_groups.total_size
+
+    @property
+    def space_saved(self) -> int:
+        return self.dup_groups.space_saved
+
+    @property
+    def new_size(self) -> int:
+        return self.dup_groups.new_size
+
+    # a copy of every duplicate group as lists of paths, dup_groups should be used instead where possible
+    @property
+    def duplicate_files(self) -> list:
+        return self.dup_groups.get_path_lists()
 
     def set_file_scanned_callback(self, callback: classmethod) -> None:
         self._file_scanned_callback = callback
 
+    def set_total_files_callback(self, callback: classmethod) -> None:
+        self._total_files_callback = callback
+
+    def set_hash_progress_callback(self, callback: classmethod) -> None:
+        self._hash_progress_callback = callback
+
     def set_dup_found_callback(self, callback: classmethod) -> None:
         self._dup_found_callback = callback
 
+    # the callback gets a dict, key is group id, value is every path in the group when the batch was sent
+    def set_dup_batch_callback(self, callback: classmethod) -> None:
+        self._dup_batch_callback = callback
+
     def set_scan_finished_callback(self, callback: classmethod) -> None:
         self._scan_finished_callback = callback
 
     def set_apply_callback(self, callback: classmethod) -> None:
         self._apply_callback = callback
 
-    def _run_file_scanned_callback(self) -> None:
+    # returns True if the callback is due, and counts it as called
+    def _is_progress_due(self, callback: classmethod, force: bool) -> bool:
+        if callback is None:
+            return False
+        now = perf_counter()
+        with self._progress_lock:
+            if not force and now - self._progress_times.get(callback, 0.0) < self.progress_interval:
+                return False
+            self._progress_times[callback] = now
+        return True
+
+    def _run_file_scanned_callback(self, force: bool = False) -> None:
         # self._files_scanned += 1
-        new_file_count = len(self.found_file_list)
-        if self._files_scanned == new_file_count:
-            return
-        self._files_scanned = new_file_count
-        # print("Files scanned: " + str(self._files_scanned))
-        if self._file_scanned_callback is not None:
+        new_file_count = len(self.files)
+        if self._files_scanned != new_file_count and self._is_progress_due(self._file_scanned_callback, force):
+            self._files_scanned = new_file_count
+            # print("Files scanned: " + str(self._files_scanned))
             self._file_scanned_callback(self._files_scanned)
+        self._run_dup_batch_callback()
+
+    def _run_total_files_callback(self, force: bool = False) -> None:
+        if self._is_progress_due(self._total_files_callback, force):
+            self._total_files_callback(self.total_file_count)
+
+    def _run_hash_progress_callback(self, force: bool = False) -> None:
+        if self._is_progress_due(self._hash_progress_callback, force):
+            self._hash_progress_callback(self.bytes_hashed, self.bytes_to_hash)
 
     def _run_dup_found_callback(self, dup_file_list: list) -> None:
         if self._dup_found_callback is not None:
             self._dup_found_callback(dup_file_list)
 
+    def _add_dup_batch(self, group_id: int) -> None:
+        if self._dup_batch_callback is None:
+            return
+        with self._dup_batch_lock:
+            self._dup_batch[group_id] = None
+        self._run_dup_batch_callback()
+
+    # the lock is held while the callback runs, so batches arrive in the order they were made
+    def _run_dup_batch_callback(self, force: bool = False) -> None:
+        if self._dup_batch_callback is None or not self._dup_batch:
+            return
+        with self._dup_batch_lock:
+            now = perf_counter()
+            if not self._dup_batch or not force and len(self._dup_batch) < self.dup_batch_size and \
+                    now - self._dup_batch_time < self.dup_batch_interval:
+                return
+            dup_batch = {group_id: self.dup_groups.get_paths(group_id) for group_id in self._dup_batch}
+            self._dup_batch = {}
+            self._dup_batch_time = now
+            self._dup_batch_callback(dup_batch)
+
     def _run_scan_finished_callback(self) -> None:
         if self._scan_finished_callback is not None:
             self._scan_finished_callback()
@@ -108,26 +680,8 @@ class DuplicateFinder:
             self._apply_callback(file_obj, dup_list)
 
     def get_duplicate_file_count(self) -> int:
-        total_dup_files = 0
-        for dup_list in self.duplicate_files:
-            total_dup_files += len(dup_list)
-        return total_dup_files
+        return self.dup_groups.file_count
 
-    def update_size_estimates(self):
-        self.total_size = 0
-        self.new_size = 0
-        self.space_saved = 0
-        
-        for dup_list in self.duplicate_files:
-            start_file_size = self._get_file_size(dup_list[0])
-            self.new_size += start_file_size
-            list_size = 0
-            for file_path in dup_list:
-                file_size = self._get_file_size(file_path)
-                list_size += file_size
-            self.total_size += list_size
-            self.space_saved += (list_size - start_file_size)
-            
     @staticmethod
     def _get_oldest_mod_time(dup_list: list) -> float:
         time_list = []
@@ -137,32 +691,161 @@ class DuplicateFinder:
                 time_list.append(date_modified)
         return min(time_list)
 
-    def apply(self) -> None:
-        for file_list in self.duplicate_files:
-            # master_file = self._get_master_file(file_list)
-            master_file, link_list, del_list, ignore_list = self._get_sorted_files(file_list)
-            oldest_mod_time = self._get_oldest_mod_time(file_list)
-            if self.use_oldest_mod_date:
-                replace_date_modifed(master_file, oldest_mod_time)
-                for file_path in ignore_list:
-                    replace_date_modifed(file_path, oldest_mod_time)
-            set_sys_links(master_file, link_list)
-            for del_path in del_list:
-                try:
-                    send2trash(del_path)
-                except PermissionError:
-                    print("PermissionError, file not deleted: " + del_path)
-                except Exception as F:
-                    print(str(F))
-                    print(del_path)
-                    # os.remove(del_path)
+    # links and deletes files by their marks on the apply workers, see apply_engine
+    # returns False if it didn't start, because the journal has an apply that never finished
+    # verify is False if verify_groups already ran, like when a front end needs to show what it took out first
+    def apply(self, verify: bool = True) -> bool:
+        self._stopping = False
+        if verify and self.verify_before_apply:
+            self.verify_groups()
+        self._apply_engine = ApplyEngine(self.apply_journal_path, self.apply_workers)
+        self._apply_engine.set_op_callback(self._apply_op_done)
+        try:
+            return self._apply_engine.run(self.get_apply_ops())
+        finally:
+            self._apply_engine = None
+
+    # the date modified and size from the scan are used, so nothing is read again here
+    def get_apply_ops(self) -> list:
+        apply_ops = []
+        for group_id in self.dup_groups.get_group_ids():
+            file_id_list = self.dup_groups.get_group(group_id)
+            master_id, link_ids, delete_ids, kept_ids, unlinked_ids = -1, [], [], [], []
+            for file_id in file_id_list:
+                file_mark = self.files.get_mark(file_id)
+                if file_mark in LINK_MARK_OPS:
+                    link_ids.append(file_id)
+                elif file_mark == FileMarks.DELETE:
+                    delete_ids.append(file_id)
+                elif file_mark == FileMarks.MASTER:
+                    master_id = file_id
+                    kept_ids.insert(0, file_id)
+                elif not self.files.links[file_id]:
+                    kept_ids.append(file_id)
+            # deleted files are put back from this one on rollback
+            source_path = self.files.get_path(kept_ids[0]) if kept_ids else ""
+            if self.is_image_group(group_id):
+                # images that only look the same can't be put back from each other, or replaced by a link
+                source_path = ""
+                if link_ids:
+                    print("Images that only look the same aren't linked, only deleted: " +
+                          self.files.get_path(link_ids[0]))
+                    unlinked_ids, link_ids = link_ids, []
+            if self.use_oldest_mod_date and kept_ids:
+                oldest_mtime = min(self.files.mtimes[file_id] for file_id in file_id_list
+                                   if not self.files.links[file_id])
+                for file_id in kept_ids:
+                    if self.files.mtimes[file_id] != oldest_mtime:
+                        apply_ops.append(self._make_apply_op("date", group_id, file_id, new_mtime_ns=oldest_mtime))
+            if master_id != -1:
+                master_path = self.files.get_path(master_id)
+                for file_id in link_ids:
+                    apply_ops.append(self._make_apply_op(LINK_MARK_OPS[self.files.get_mark(file_id)], group_id,
+                                                         file_id, master_path))
+            if delete_ids and not kept_ids and not unlinked_ids:
+                # these would be the last copies of the bytes, or of every image that looks like them
+                print("No file is kept in this group, none of it is deleted: " + self.files.get_path(delete_ids[0]))
+                delete_ids = []
+            for file_id in delete_ids:
+                apply_ops.append(self._make_apply_op("delete", group_id, file_id, source_path))
+        return apply_ops
+
+    # a file that stays as it is after apply, the only copies of the bytes once the rest are linked or deleted
+    def _is_kept_file(self, file_id: int) -> bool:
+        file_mark = self.files.get_mark(file_id)
+        if file_mark == FileMarks.MASTER:
+            return True
+        return file_mark not in LINK_MARK_OPS and file_mark != FileMarks.DELETE and not self.files.links[file_id]
+
+    def _make_apply_op(self, op_name: str, group_id: int, file_id: int, source_path: str = "",
+                       new_mtime_ns: int = 0) -> dict:
+        return make_apply_op(op_name, group_id, self.files.get_path(file_id), self.files.sizes[file_id],
+                             self.files.mtimes[file_id], source_path, new_mtime_ns)
+
+    # files with the same size and date modified as in the search are trusted, the rest are hashed again,
+    # partial hash first, and taken out of their group if they don't match it anymore
+    # so apply can run long after the search, without searching again
+    def verify_groups(self) -> dict:
+        verify_counts = {"files": 0, "changed": 0, "removed": 0, "groups_removed": 0}
+        group_count = len(self.dup_groups)
+        with ThreadPoolExecutor(max_workers=max(self.apply_workers, 1)) as executor:
+            for file_count, changed_count, removed_list in executor.map(self._verify_group,
+                                                                        self.dup_groups.get_group_ids()):
+                verify_counts["files"] += file_count
+                verify_counts["changed"] += changed_count
+                verify_counts["removed"] += len(removed_list)
+                for file_id in removed_list:
+                    self.dup_groups.remove(file_id)
+        verify_counts["groups_removed"] = group_count - len(self.dup_groups)
+        if verify_counts["changed"]:
+            print("Files changed since the search: " + str(verify_counts["changed"]) + ", removed from their group: " +
+                  str(verify_counts["removed"]) + ", groups removed: " + str(verify_counts["groups_removed"]))
+        return verify_counts
+
+    # returns (files checked, files changed, file ids that don't belong in the group anymore)
+    def _verify_group(self, group_id: int) -> tuple:
+        file_id_list = list(self.dup_groups.get_group(group_id))
+        unchanged_list, changed_list, removed_list = [], [], []
+        for file_id in file_id_list:
+            try:
+                file_stat = os.stat(self.files.get_path(file_id))
+            except OSError:
+                removed_list.append(file_id)
+                continue
+            if file_stat.st_size != self.files.sizes[file_id]:
+                removed_list.append(file_id)
+            elif file_stat.st_mtime_ns != self.files.mtimes[file_id]:
+                changed_list.append((file_id, file_stat.st_mtime_ns))
+            else:
+                unchanged_list.append(file_id)
+        changed_count = len(file_id_list) - len(unchanged_list)
+        for file_id, mtime_ns in changed_list:
+            if self._verify_changed_file(file_id, unchanged_list):
+                # so apply sees it as the same file as the one checked here
+                self.files.mtimes[file_id] = mtime_ns
+                unchanged_list.append(file_id)
+            else:
+                removed_list.append(file_id)
+        # the files left would be linked to or deleted in favor of a file that isn't the same anymore
+        kept_list = [file_id for file_id in file_id_list if self._is_kept_file(file_id)]
+        if any(file_id in removed_list and self.files.get_mark(file_id) == FileMarks.MASTER
+               for file_id in file_id_list) or kept_list and all(file_id in removed_list for file_id in kept_list):
+            removed_list = file_id_list
+        return len(file_id_list), changed_count, removed_list
+
+    # uses the cheapest check that's enough: the partial hash, then the full hash if the search made one,
+    # or comparing it byte by byte to a file in the group that didn't change
+    def _verify_changed_file(self, file_id: int, unchanged_list: list) -> bool:
+        file_path = self.files.get_path(file_id)
+        partial_hash = self.files.partial_hashes[file_id]
+        if partial_hash:
+            new_partial_hash, small_file_hash, bytes_read = make_partial_hash(file_path, self.files.sizes[file_id],
+                                                                              self.hash_algorithm)
+            self._add_bytes_read(bytes_read)
+            if new_partial_hash != partial_hash:
+                return False
+            if small_file_hash:
+                return True
+        full_hash = self.files.full_hashes[file_id]
+        if full_hash:
+            new_full_hash, bytes_read = make_hash(file_path, self.hash_algorithm, self.read_blocksize)
+            self._add_bytes_read(bytes_read)
+            return new_full_hash == full_hash
+        if unchanged_list:
+            return self._compare_files(unchanged_list[0], file_id)
+        return False
+
+    def _apply_op_done(self, apply_op: dict) -> None:
+        file_obj = self.files.get(apply_op["path"])
+        if file_obj is not None:
+            self._run_apply_callback(file_obj, self.get_dup_list(apply_op["path"]))
 
     # run a callback with multiple lists
     # files objs deleted and files made system links
     # also a callback on the current file
     # use file objs in the 2 lists
     def apply_finish(self) -> None:
-        for file_list in self.duplicate_files:
+        for file_list in self.dup_groups.get_path_lists():
             # master_file = self._get_master_file(file_list)
             master_file, link_list, del_list = self._get_sorted_files(file_list)
             set_sys_links(master_file, link_list)
@@ -177,7 +860,7 @@ class DuplicateFinder:
                     # os.remove(del_path)
 
     def apply_old(self) -> None:
-        for file_list in self.duplicate_files:
+        for file_list in self.dup_groups.get_path_lists():
             # master_file = self._get_master_file(file_list)
             master_file, link_list, del_list = self._get_sorted_files(file_list)
             set_sys_links(master_file, link_list)
@@ -211,9 +894,9 @@ class DuplicateFinder:
         return master_file, link_list, del_list, ignore_list
     
     def get_dup_list(self, file_path: str) -> list:
-        for dup_list in self.duplicate_files:
-            if file_path in dup_list:
-                return dup_list
+        group_id = self.dup_groups.get_group_id(self.files.get_id(file_path))
+        if group_id != -1:
+            return self.dup_groups.get_paths(group_id)
 
     def add_search_dir(self, search_dir: str) -> None:
         if os.path.isdir(search_dir) and search_dir not in self.search_directory_list:
@@ -235,134 +918,785 @@ class DuplicateFinder:
         if file_ext not in self.ext_list:
             self.ext_list.append(file_ext)
 
+    # without count_files_first, the total file count starts at the count from the last search
+    # and goes up as files are found, instead of walking every directory twice
     def start_search(self, total_file_count: bool = False) -> None:
-        if total_file_count or self.total_file_count == 0:
+        self._check_hash_algorithm()
+        self._check_image_mode()
+        if self.cache_path:
+            self.hash_cache = HashCache(self.cache_path, self.hash_algorithm)
+        if self.snapshot_path:
+            self._load_snapshot()
+        if total_file_count or self.count_files_first:
             self.get_total_file_count()
+        else:
+            self.total_file_count = self._get_file_count_estimate()
+        self._run_total_files_callback(True)
         self._files_scanned = 0
-        search_threads = []
-        for search_dir in self.search_directory_list:
-            search_thread = Thread(target=self._search_directory, args=(search_dir, ))
-            search_thread.start()
-            search_threads.append(search_thread)
-            # self._search_directory(search_dir)
-            
-        for search_thread in search_threads:
-            search_thread.join()
-            
+        hash_threads = self._start_hash_workers()
+        self._walk_parallel(self._add_found_files)
+        self._stop_hash_workers(hash_threads)
+        if self._image_file_ids and not self._stopping:
+            self._find_similar_images()
+
+        self.files.sort()
+        self._run_file_scanned_callback(True)
+        self._run_hash_progress_callback(True)
+        if not self._stopping:
+            self.total_file_count = len(self.files)
+            self._set_file_count_estimate(self.total_file_count)
+            self._run_total_files_callback(True)
+            if self.snapshot_path:
+                self._save_snapshot()
+        # anything left from the snapshot wasn't found in this search
+        self._snapshot_directories, self._visited_directories, self._snapshot_hashes = {}, {}, {}
+        self._run_dup_batch_callback(True)
+        if self.similar_min_percent > 0 and not self._stopping:
+            self.find_similar_files()
+        if self.hash_cache is not None:
+            self.hash_cache.evict(self.cache_max_age)
+            self.hash_cache.close()
+            print("HASH CACHE: " + str(self.hash_cache.get_stats()))
         print("FINISHED")
         self._run_scan_finished_callback()
 
+    def _check_image_mode(self) -> None:
+        if self.image_mode and not can_hash_images():
+            print("WARNING: image mode needs the numpy and pillow modules, images are compared by their bytes")
+            self.image_mode = False
+        if self.image_hash not in IMAGE_HASH_SIZES:
+            raise Exception("Unknown image hash: " + self.image_hash)
+        self._image_exts = tuple(file_ext.lower() for file_ext in self.ext_list) or IMAGE_EXTS
+
+    # images are hashed in batches in worker processes, since most of the time is spent decoding them
+    def _get_image_hashes(self) -> dict:
+        image_hashes = {}  # key is file id
+        worker_count = max(self.hash_workers, 1)
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            pending = deque()
+            for batch_start in range(0, len(self._image_file_ids), IMAGE_BATCH_SIZE):
+                if self._stopping:
+                    break
+                file_id_list = self._image_file_ids[batch_start:batch_start + IMAGE_BATCH_SIZE]
+                pending.append((file_id_list, executor.submit(
+                    hash_images, [self.files.get_path(file_id) for file_id in file_id_list], self.image_hash)))
+                if len(pending) >= worker_count * 2:
+                    self._add_image_hashes(image_hashes, *pending.popleft())
+            while pending:
+                self._add_image_hashes(image_hashes, *pending.popleft())
+        return image_hashes
+
+    def _add_image_hashes(self, image_hashes: dict, file_id_list: list, hash_future) -> None:
+        for file_id, image_hash in zip(file_id_list, hash_future.result()):
+            self._add_bytes_read(self.files.sizes[file_id])
+            if image_hash != -1:
+                image_hashes[file_id] = image_hash
+
+    # the biggest image left that isn't in a group yet is the first in a new group,
+    # with every other image left within the distance of it, closest first
+    # so every image in a group looks like the first one, even if they don't all look like each other
+    def _find_similar_images(self) -> None:
+        image_hashes = self._get_image_hashes()
+        bk_tree = BKTree()
+        for file_id, image_hash in image_hashes.items():
+            bk_tree.add(image_hash, file_id)
+        grouped = set()
+        for file_id in sorted(image_hashes, key=lambda image_file_id: -self.files.sizes[image_file_id]):
+            if file_id in grouped:
+                continue
+            similar_list = sorted((distance, similar_file_id) for distance, similar_file_id in
+                                  bk_tree.search(image_hashes[file_id], self.image_distance)
+                                  if similar_file_id not in grouped and similar_file_id != file_id)
+            if not similar_list:
+                continue
+            group_file_ids = [file_id] + [similar_file_id for _, similar_file_id in similar_list]
+            grouped.update(group_file_ids)
+            group_id = self.dup_groups.add((IMAGE_GROUP, "%016x" % image_hashes[file_id], file_id), group_file_ids)
+            if self._dup_found_callback is not None:
+                self._run_dup_found_callback(self.dup_groups.get_paths(group_id))
+            self._add_dup_batch(group_id)
+        print("Images: " + str(len(image_hashes)) + " hashed, " + str(len(grouped)) + " in groups")
+
+    def is_image_group(self, group_id: int) -> bool:
+        group_key = self.dup_groups.get_group_key(group_id)
+        return group_key is not None and group_key[0] == IMAGE_GROUP
+
+    # only 1 file of each duplicate group and each set of hardlinks is chunked, the others have the same bytes
+    def _get_similar_candidates(self) -> list:
+        file_id_list = []
+        for file_id in self.files.get_ids():
+            if self.files.links[file_id] or self.files.sizes[file_id] < max(self.similar_min_size, 1):
+                continue
+            group_id = self.dup_groups.get_group_id(file_id)
+            if group_id != -1 and self.dup_groups.get_group(group_id)[0] != file_id:
+                continue
+            if self.inode_dict.get((self.files.devices[file_id], self.files.inodes[file_id]), file_id) != file_id:
+                continue
+            file_id_list.append(file_id)
+        return file_id_list
+
+    # chunking is plain python, so it always runs in processes, the hash backend doesn't matter
+    # only a few files are chunked ahead of the ones being added to the index, so their chunks don't pile up
+    def find_similar_files(self) -> list:
+        chunk_index = ChunkIndex()
+        file_id_list = self._get_similar_candidates()
+        worker_count = max(self.hash_workers, 1)
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            pending = deque()
+            for file_id in file_id_list:
+                if self._stopping:
+                    break
+                pending.append((file_id, executor.submit(chunk_file, self.files.get_path(file_id),
+                                                         self.chunk_avg_size, self.read_blocksize)))
+                if len(pending) >= worker_count * 2:
+                    self._add_chunked_file(chunk_index, *pending.popleft())
+            while pending:
+                self._add_chunked_file(chunk_index, *pending.popleft())
+        self.similar_files = [(self.files.get_path(file_id), self.files.get_path(other_file_id), shared_bytes,
+                               similarity) for file_id, other_file_id, shared_bytes, similarity in
+                              chunk_index.get_similar_pairs(self.files.sizes, self.similar_min_percent)]
+        print("Similar files: " + str(len(self.similar_files)) + " pairs from " + str(len(file_id_list)) +
+              " files, " + str(len(chunk_index)) + " chunks")
+        return self.similar_files
+
+    def _add_chunked_file(self, chunk_index: ChunkIndex, file_id: int, chunk_future) -> None:
+        file_chunks, bytes_read = chunk_future.result()
+        self._add_bytes_read(bytes_read)
+        chunk_index.add(file_id, file_chunks)
+
+    # runs the search and yields (group id, paths) for each new or changed duplicate group as the batches come in,
+    # a group is yielded again with all of its paths when more files are found for it
+    # the search waits while max_pending groups haven't been taken, and is stopped if the loop is left early
+    def iter_groups(self, max_pending: int = 256):
+        group_queue, search_thread = self._start_group_stream(max_pending)
+        try:
+            while True:
+                group = self._get_stream_group(group_queue, search_thread)
+                if group is None:
+                    return
+                yield group
+        finally:
+            self._stop_group_stream(search_thread)
+
+    # same as iter_groups, waiting on the search is done in the event loop's default executor
+    async def aiter_groups(self, max_pending: int = 256):
+        loop = asyncio.get_running_loop()
+        group_queue, search_thread = self._start_group_stream(max_pending)
+        try:
+            while True:
+                group = await loop.run_in_executor(None, self._get_stream_group, group_queue, search_thread)
+                if group is None:
+                    return
+                yield group
+        finally:
+            # stopped right away, the generator can be closed while the loop is shutting down
+            if search_thread.is_alive():
+                self.stop()
+            await loop.run_in_executor(None, search_thread.join)
+
+    # any dup batch callback already set still gets every batch
+    def _start_group_stream(self, max_pending: int) -> tuple:
+        group_queue = queue.Queue(max_pending)
+        batch_callback = self._dup_batch_callback
+
+        def put_batch(dup_batch: dict) -> None:
+            if batch_callback is not None:
+                batch_callback(dup_batch)
+            for group in dup_batch.items():
+                if not self._put_until_stopped(group_queue, group):
+                    return
+
+        def run_search() -> None:
+            try:
+                self.start_search()
+            finally:
+                self._dup_batch_callback = batch_callback
+
+        self._dup_batch_callback = put_batch
+        search_thread = Thread(target=run_search)
+        search_thread.start()
+        return group_queue, search_thread
+
+    # returns None once the search is done and every group was taken
+    @staticmethod
+    def _get_stream_group(group_queue: queue.Queue, search_thread: Thread) -> tuple:
+        while True:
+            try:
+                return group_queue.get(timeout=0.1)
+            except queue.Empty:
+                if not search_thread.is_alive() and group_queue.empty():
+                    return None
+
+    def _stop_group_stream(self, search_thread: Thread) -> None:
+        if search_thread.is_alive():
+            self.stop()
+        search_thread.join()
+
+    def _check_hash_algorithm(self) -> None:
+        if self.hash_algorithm in HASH_ALGORITHMS:
+            return
+        if self.hash_algorithm == "xxh3":
+            print("WARNING: xxhash module not installed, using " + FALLBACK_HASH_ALGORITHM + " instead of xxh3")
+            self.hash_algorithm = FALLBACK_HASH_ALGORITHM
+        else:
+            raise Exception("Unknown hash algorithm: " + str(self.hash_algorithm))
+
+    # anything that changes which files are found
+    def _get_search_key(self) -> str:
+        return "|".join(self.search_directory_list + self.exclude_directory_list +
+                        self.ext_list + self.exclude_ext_list + [str(self.ignore_links)])
+
+    def _get_file_count_key(self) -> str:
+        return "file_count " + self._get_search_key()
+
+    # the directories from the snapshot are only used if the search settings are the same
+    def _load_snapshot(self) -> None:
+        self._snapshot_directories = {}
+        self._visited_directories = {}
+        self._snapshot_hashes = {}
+        if not self.incremental or not os.path.isfile(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as snapshot_io:
+                snapshot = json.load(snapshot_io)
+        except (OSError, ValueError) as F:
+            print("Unable to load snapshot: " + self.snapshot_path + "\n" + str(F))
+            return
+        if snapshot.get("search_key") != self._get_search_key():
+            print("Search settings changed since the snapshot was saved, searching everything")
+            return
+        try:
+            for directory, (dir_mtime, sub_directory_list, file_record_list) in snapshot["directories"].items():
+                file_record_list = [(name, link) for name, link in file_record_list]
+                self._snapshot_directories[directory] = (dir_mtime, sub_directory_list, file_record_list)
+            # the directories are still good with another hash algorithm, but not the hashes
+            if snapshot.get("hash_algorithm") == self.hash_algorithm:
+                self._snapshot_hashes = snapshot["hashes"]
+        except (KeyError, TypeError, ValueError) as F:
+            print("Unable to load snapshot: " + self.snapshot_path + "\n" + str(F))
+            self._snapshot_directories = {}
+
+    # every file a directory had when it was searched is in self.files, so only the file names and link flags are saved,
+    # the rest of each file is checked again on the next search anyway
+    def _save_snapshot(self) -> None:
+        snapshot_directories = {}
+        for directory, (dir_mtime, sub_directory_list) in self._visited_directories.items():
+            file_record_list = [(name, bool(self.files.links[file_id]))
+                                for name, file_id in self.files.get_directory_files(directory).items()]
+            snapshot_directories[directory] = (dir_mtime, sub_directory_list, file_record_list)
+        snapshot_hashes = {}
+        for file_id in self.files.get_ids():
+            partial_hash = self.files.partial_hashes[file_id]
+            full_hash = self.files.full_hashes[file_id]
+            if partial_hash or full_hash:
+                snapshot_hashes[self.files.get_path(file_id)] = (self.files.get_key(file_id), partial_hash, full_hash)
+        snapshot = {
+            "search_key": self._get_search_key(),
+            "hash_algorithm": self.hash_algorithm,
+            "directories": snapshot_directories,
+            "hashes": snapshot_hashes,
+        }
+        # write to a temp file first so a crash can't leave a broken snapshot behind
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as snapshot_io:
+            json.dump(snapshot, snapshot_io)
+        os.replace(temp_path, self.snapshot_path)
+
+    def _get_file_count_estimate(self) -> int:
+        if self.hash_cache is not None:
+            return self.hash_cache.get_info(self._get_file_count_key()) or self.file_count_estimate
+        return self.file_count_estimate
+
+    def _set_file_count_estimate(self, file_count: int) -> None:
+        self.file_count_estimate = file_count
+        if self.hash_cache is not None:
+            self.hash_cache.set_info(self._get_file_count_key(), file_count)
+
+    # the directory search only groups files by size, anything that needs hashing goes through these workers,
+    # with the process backend each worker thread waits on one hash from the pool at a time
+    def _start_hash_workers(self) -> list:
+        self._device_limits = {}
+        for device_path, device_workers in self.device_workers.items():
+            try:
+                self._device_limits[os.stat(device_path).st_dev] = device_workers
+            except OSError as F:
+                print("Unable to find the device of: " + device_path + "\n" + str(F))
+        self._hash_queue = DeviceQueue(self.hash_queue_size, self._get_hash_job_key, self._get_device_limit)
+        if self.hash_backend == "process":
+            self._hash_executor = ProcessPoolExecutor(self.hash_workers)
+        elif self.hash_backend != "thread":
+            raise Exception("Unknown hash backend: " + str(self.hash_backend))
+        hash_threads = []
+        for _ in range(max(self.hash_workers, 1)):
+            hash_thread = Thread(target=self._hash_worker)
+            hash_thread.start()
+            hash_threads.append(hash_thread)
+        return hash_threads
+
+    def _stop_hash_workers(self, hash_threads: list) -> None:
+        self._hash_queue.finish()
+        for hash_thread in hash_threads:
+            hash_thread.join()
+        if self._hash_executor is not None:
+            self._hash_executor.shutdown(cancel_futures=True)
+            self._hash_executor = None
+
+    def _hash_worker(self) -> None:
+        while True:
+            self._check_quit()
+            try:
+                hash_job = self._hash_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if hash_job is None:
+                return
+            try:
+                self._add_partial_hashed_file(*hash_job)
+            except Exception as F:
+                # a worker that stops here would leave the search waiting on the queue forever
+                print("Unable to hash file: " + self.files.get_path(hash_job[0]) + "\n" + str(F))
+            finally:
+                self._hash_queue.task_done(hash_job)
+
+    def _get_hash_job_key(self, hash_job: tuple) -> tuple:
+        return self.files.devices[hash_job[0]], self.files.inodes[hash_job[0]]
+
+    def _get_device_limit(self, device: int) -> int:
+        if device in self._device_limits:
+            return self._device_limits[device]
+        if is_rotational(device):
+            return self.hdd_workers
+        return self.ssd_workers or self.hash_workers
+
+    # blocks while the queue is full, so the directory search can't get too far ahead of hashing
+    def _put_hash_job(self, hash_job) -> bool:
+        return self._put_until_stopped(self._hash_queue, hash_job)
+
+    # returns False if the search was stopped before there was room in the queue
+    def _put_until_stopped(self, wait_queue: queue.Queue, item) -> bool:
+        while not self._stopping:
+            try:
+                wait_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
     def reset(self) -> None:
-        self.duplicate_files = []
-        self.found_file_list = []
-        self.file_size_dict = {}
-        self.file_hash_dict = {}
+        self.files = FileRegistry()
+        self.dup_groups = DuplicateGroups(self.files)
+        self.file_size_groups = {}
+        self.partial_hash_groups = {}
+        self.full_hash_groups = {}
+        self.compare_groups = {}
+        self._compare_locks = {}
+        self.bytes_read = 0
+        self.inode_dict = {}
+        self.hardlink_groups = {}
+        self.hardlink_size = 0
         self.total_file_count = 0
+        self.bytes_to_hash = 0
+        self.bytes_hashed = 0
         self._files_scanned = 0
-        self.total_size = 0
-        self.space_saved = 0
-        self.new_size = 0
+        self._dup_batch = {}
+        self._dup_batch_time = 0.0
+        self.similar_files = []
+        self._image_file_ids = []
         self._stopping = False
 
     def get_total_file_count(self) -> int:
-        file_count = 0
-        for search_dir in self.search_directory_list:
-            file_count += self._get_total_file_count_dir(search_dir)
-        self.total_file_count = file_count
-        return file_count
+        file_count = [0]
+
+        def count_files(directory: str, file_record_list: list) -> None:
+            with self._lock:
+                file_count[0] += len(file_record_list)
+
+        self._walk_parallel(count_files)
+        self.total_file_count = file_count[0]
+        return file_count[0]
     
     def _check_quit(self):
         if self._stopping:
             quit()
 
-    def _search_directory(self, directory: str) -> None:
-        self._check_quit()
-        path_list = os.listdir(directory)
-        # print("SCANNING DIRECTORY: " + directory)
-        for path in path_list:
+    # any directory found can be picked up by any search worker,
+    # so one large search directory is still searched in parallel
+    def _walk_parallel(self, file_entry_handler) -> None:
+        directory_queue = DirectoryQueue(self.search_directory_list)
+        worker_count = max(self.search_workers, 1)
+        search_threads = []
+        for _ in range(worker_count):
+            search_thread = Thread(target=self._search_worker, args=(directory_queue, file_entry_handler))
+            search_thread.start()
+            search_threads.append(search_thread)
+        while not self._stopping and not directory_queue.wait(0.1):
+            pass
+        directory_queue.finish(worker_count)
+        for search_thread in search_threads:
+            search_thread.join()
+
+    def _search_worker(self, directory_queue: DirectoryQueue, file_entry_handler) -> None:
+        while True:
+            directory = directory_queue.get()
+            if directory is None:
+                return
+            # the directory is always marked done, or the search would wait for it forever
+            try:
+                self._check_quit()
+                sub_directory_list, file_record_list = self._list_directory(directory)
+                for sub_directory in sub_directory_list:
+                    directory_queue.put(sub_directory)
+                file_entry_handler(directory, file_record_list)
+            except Exception as F:
+                print("Unable to search directory: " + directory + "\n" + str(F))
+            finally:
+                directory_queue.task_done()
+
+    # file records are (file name, is link, file key, link count)
+    def _add_found_files(self, directory: str, file_record_list: list) -> None:
+        for name, link, file_key, link_count in file_record_list:
             self._check_quit()
-            full_path = os.path.join(directory, path)
-            if os.path.isdir(full_path):
-                if is_junction(full_path):
-                    print("SKIPPING DIR JUNCTION: " + full_path)
-                    continue
-                # if not is_junction(full_path) and full_path not in self.exclude_directory_list:
-                if full_path not in self.exclude_directory_list:
-                    # if not os.path.islink(full_path):
+            file_id = self.files.add(directory, name, link, file_key, link_count)
+            if len(self.files) > self.total_file_count:
+                self.total_file_count = len(self.files)
+                self._run_total_files_callback()
+            if (link or link_count > 1) and self._add_hardlink(file_id, file_key):
+                self._run_file_scanned_callback()
+                continue
+            self._load_snapshot_hashes(file_id)
+            self._add_found_file(file_id)
+
+    # paths to a file that was already found are never hashed, counted in sizes, or added as duplicates,
+    # they are already deduplicated
+    def _add_hardlink(self, file_id: int, file_key: tuple) -> bool:
+        device, inode, file_size = file_key[:3]
+        if not inode:
+            return False
+        with self._lock:
+            first_file_id = self.inode_dict.setdefault((device, inode), file_id)
+            if first_file_id == file_id:
+                return False
+            self.hardlink_groups.setdefault((device, inode), [first_file_id]).append(file_id)
+            self.hardlink_size += file_size
+        return True
+
+    # only paths to the same file, the first path in each list is the one that was hashed
+    def get_hardlink_groups(self) -> list:
+        with self._lock:
+            return [[self.files.get_path(file_id) for file_id in hardlink_group]
+                    for hardlink_group in self.hardlink_groups.values()]
+
+    def get_hardlink_file_count(self) -> int:
+        return sum(len(hardlink_group) - 1 for hardlink_group in self.get_hardlink_groups())
+
+    # a directory's date modified only changes when something is added, removed or renamed in it,
+    # so in an incremental search the files of an unchanged directory are taken from the snapshot
+    def _list_directory(self, directory: str) -> tuple:
+        try:
+            dir_mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return [], []
+        snapshot_directory = self._snapshot_directories.pop(directory, None)
+        if snapshot_directory is not None and snapshot_directory[0] == dir_mtime:
+            # writing to a file doesn't change the date modified of its directory, only adding or removing files does,
+            # so only listing the directory is skipped, every file is still checked for a new key
+            sub_directory_list = snapshot_directory[1]
+            file_record_list = self._stat_file_records(directory, snapshot_directory[2])
+        else:
+            sub_directory_list, file_entry_list = self._scan_directory(directory)
+            file_record_list = []
+            for file_entry in file_entry_list:
+                try:
+                    file_stat = file_entry.stat()
+                    file_record_list.append((file_entry.name, file_entry.is_symlink(),
+                                             get_file_key(file_entry.path, file_stat), file_stat.st_nlink))
+                except OSError:
+                    pass
+        if self.snapshot_path:
+            self._visited_directories[directory] = (dir_mtime, sub_directory_list)
+        return sub_directory_list, file_record_list
+
+    # a file with a new key has changed since the snapshot, so its hashes from the snapshot aren't used
+    @staticmethod
+    def _stat_file_records(directory: str, snapshot_record_list: list) -> list:
+        file_record_list = []
+        for name, link in snapshot_record_list:
+            file_path = os.path.join(directory, name)
+            try:
+                file_stat = os.stat(file_path)
+                file_record_list.append((name, link, get_file_key(file_path, file_stat), file_stat.st_nlink))
+            except OSError:
+                pass
+        return file_record_list
+
+    # returns the directories to search next and the files in this directory that pass the filters
+    def _scan_directory(self, directory: str) -> tuple:
+        sub_directory_list, file_entry_list = [], []
+        try:
+            with os.scandir(directory) as dir_entries:
+                for dir_entry in dir_entries:
                     try:
-                        self._search_directory(full_path)
-                    except PermissionError:
+                        if dir_entry.is_dir():
+                            if dir_entry.is_symlink() or is_junction_entry(dir_entry):
+                                print("SKIPPING DIR JUNCTION: " + dir_entry.path)
+                            elif dir_entry.path not in self.exclude_directory_list:
+                                sub_directory_list.append(dir_entry.path)
+                        elif self._valid_ext(dir_entry.name) and not (self.ignore_links and dir_entry.is_symlink()):
+                            file_entry_list.append(dir_entry)
+                    except OSError:
                         pass
-            elif self._valid_ext(full_path) and not self._check_link(full_path):
-                file_obj = File(full_path)
-                self.found_file_objs[full_path] = file_obj
-                self.found_file_list.append(full_path)
-                for found_file in self.found_file_list:
-                    if found_file == full_path:
-                        continue
-                    self._check_quit()
-                    ass = self._compare_file(found_file, full_path)
-                    if ass:
-                        # print("FOUND DUPLICATE FILE:\n\t" + found_file + "\n\t" + full_path)
-                        self._add_duplicate_file(found_file, full_path)
-                        # file_obj = File(full_path)
-                        # self.found_file_objs[full_path] = file_obj
-            # else:
-            #     print("SKIPPING SYSTEM LINK: " + full_path)
-                # self._run_file_scanned_callback()
-
-    def _get_total_file_count_dir(self, directory: str) -> int:
-        try:
-            file_count = 0
-            path_list = os.listdir(directory)
-            for path in path_list:
-                full_path = os.path.join(directory, path)
-                if os.path.isdir(full_path):
-                    if is_junction(full_path):
-                        print("SKIPPING DIR JUNCTION: " + full_path)
-                        continue
-                    file_count += self._get_total_file_count_dir(full_path)
-                # elif not os.path.islink(full_path):
-                # elif self._valid_ext(full_path) and not (self.ignore_links and os.path.islink(full_path)):
-                elif self._valid_ext(full_path) and not self._check_link(full_path):
-                    file_count += 1
-            return file_count
-        except PermissionError:
-            return 0
-
-    def _add_duplicate_file(self, compared_file: str, duplicate_file: str):
-        for file_list in self.duplicate_files:
+        except OSError:
+            pass
+        return sub_directory_list, file_entry_list
+
+    # only files that share a size with another file ever get hashed
+    def _add_found_file(self, file_id: int) -> None:
+        file_size = self.files.sizes[file_id]
+        self._run_file_scanned_callback()
+        if file_size == 0:
+            return
+        if self.image_mode and is_image_path(self.files.get_path(file_id), self._image_exts):
+            with self._lock:
+                self._image_file_ids.append(file_id)
+            return
+        hash_list = self._add_to_stage_group(self.file_size_groups, file_size, file_id)
+        for hash_file_id in hash_list:
+            self._add_hash_progress(min(file_size, PARTIAL_BLOCKSIZE * 2), 0)
+            if not self._put_hash_job((hash_file_id, file_size)):
+                self._check_quit()
+
+    def _add_partial_hashed_file(self, file_id: int, file_size: int) -> None:
+        partial_hash = self.files.partial_hashes[file_id]
+        if not partial_hash:
+            partial_hash = self._get_cached_hash(file_id, min(file_size, PARTIAL_BLOCKSIZE * 2), False)
+            if partial_hash:
+                self.files.partial_hashes[file_id] = partial_hash
+                if file_size <= PARTIAL_BLOCKSIZE * 2:
+                    self.files.full_hashes[file_id] = partial_hash
+            else:
+                partial_hash = self._make_partial_hash(file_id, file_size)
+                self._set_cached_hash(file_id, partial_hash, self.files.full_hashes[file_id])
+        self._add_hash_progress(0, min(file_size, PARTIAL_BLOCKSIZE * 2))
+        if not partial_hash:
+            return
+        partial_key = (file_size, partial_hash)
+        hash_list = self._add_to_stage_group(self.partial_hash_groups, partial_key, file_id)
+        if hash_list and self._add_compared_files(partial_key, hash_list):
+            return
+        for hash_file_id in hash_list:
             self._check_quit()
-            if compared_file in file_list:
-                file_list.append(duplicate_file)
-                break
+            self._add_hashed_file(hash_file_id, file_size)
+
+    # a few big files with the same partial hash are compared byte by byte instead of hashed,
+    # files that aren't the same usually differ early on, so they don't have to be read to the end
+    # each partial hash group picks when it gets its second file, and switches to hashing if it gets too big,
+    # then only 1 file of each set of same files is hashed
+    # returns False if the files need to be hashed
+    def _add_compared_files(self, partial_key: tuple, file_id_list: list) -> bool:
+        with self._lock:
+            compare_lock = self._compare_locks.setdefault(partial_key, Lock())
+        with compare_lock:
+            if partial_key not in self.compare_groups:
+                self.compare_groups[partial_key] = [] if self._use_compare(partial_key[0], file_id_list) else None
+            compare_groups = self.compare_groups[partial_key]
+            if compare_groups is None:
+                return False
+            if sum(len(compare_group) for compare_group in compare_groups) + len(file_id_list) > \
+                    self.compare_max_files:
+                self._hash_compare_groups(partial_key[0], compare_groups)
+                self.compare_groups[partial_key] = None
+                return False
+            self._check_quit()
+            self._add_compared_file_list(partial_key[0], compare_groups, file_id_list)
+            return True
+
+    # files found together are compared side by side, so each is read once, the same as hashing them,
+    # a file found later is read once along with the first file of each group, 3 files found 1 at a time
+    # are read 4 times instead of 3, comparing only saves reading when files differ
+    def _use_compare(self, file_size: int, file_id_list: list) -> bool:
+        if self.compare_max_files < 2 or file_size < self.compare_min_size:
+            return False
+        # every file of the same size found so far, the partial hash group can't get bigger than that
+        with self._lock:
+            if len(self.file_size_groups.get(file_size, ())) > self.compare_max_files:
+                return False
+        # hashes from the cache or snapshot don't need the files to be read at all
+        for file_id in file_id_list:
+            if not self.files.full_hashes[file_id]:
+                file_hash = self._get_cached_hash(file_id, file_size, True)
+                if not file_hash:
+                    return True
+                self.files.full_hashes[file_id] = file_hash
+        return False
+
+    # the new files are read side by side with the first file of each group, each new file joins the group it matches,
+    # or starts a new one with the other new files that match it
+    # the duplicate group key has no hash, it's set by _hash_compare_groups if the group is hashed later
+    def _add_compared_file_list(self, file_size: int, compare_groups: list, file_id_list: list) -> None:
+        self._add_hash_progress(file_size * len(file_id_list), 0)
+        compare_file_ids = [compare_group[0] for compare_group in compare_groups] + file_id_list
+        group_count = len(compare_groups)
+        for index_list in self._compare_file_list(compare_file_ids):
+            new_file_ids = [compare_file_ids[index] for index in index_list if index >= group_count]
+            if not new_file_ids:
+                continue
+            if index_list[0] < group_count:
+                compare_group = compare_groups[index_list[0]]
+            else:
+                compare_group = [new_file_ids.pop(0)]
+                compare_groups.append(compare_group)
+            for file_id in new_file_ids:
+                compare_group.append(file_id)
+                self._add_duplicate_file((file_size, "", compare_group[0]), compare_group[0], file_id)
+        self._add_hash_progress(0, file_size * len(file_id_list))
+
+    def _hash_compare_groups(self, file_size: int, compare_groups: list) -> None:
+        for compare_group in compare_groups:
+            self._check_quit()
+            file_hash = self._get_full_hash(compare_group[0], file_size)
+            if not file_hash:
+                continue
+            for file_id in compare_group[1:]:
+                self.files.full_hashes[file_id] = file_hash
+                self._set_cached_hash(file_id, "", file_hash)
+            with self._lock:
+                self.full_hash_groups.setdefault((file_size, file_hash), []).extend(compare_group)
+            if len(compare_group) > 1:
+                self.dup_groups.set_group_key(self.dup_groups.get_group_id(compare_group[0]), (file_size, file_hash))
+
+    def _get_full_hash(self, file_id: int, file_size: int) -> str:
+        file_hash = self.files.full_hashes[file_id]
+        if not file_hash:
+            self._add_hash_progress(file_size, 0)
+            file_hash = self._get_cached_hash(file_id, file_size, True)
+            if file_hash:
+                self.files.full_hashes[file_id] = file_hash
+            else:
+                file_hash = self._make_hash(file_id)
+                self._set_cached_hash(file_id, "", file_hash)
+            self._add_hash_progress(0, file_size)
+        return file_hash
+
+    def _add_hashed_file(self, file_id: int, file_size: int) -> None:
+        file_hash = self._get_full_hash(file_id, file_size)
+        if not file_hash:
+            return
+        with self._lock:
+            hash_group = self.full_hash_groups.setdefault((file_size, file_hash), [])
+            hash_group.append(file_id)
+            if len(hash_group) < 2:
+                return
+            compared_file_list = hash_group[:-1] if self.verify_bytes else hash_group[:1]
+        group_key = (file_size, file_hash)
+        compared_file_id = compared_file_list[0]
+        if self.verify_bytes:
+            compared_file_id = self._verify_file(compared_file_list, file_id)
+            if compared_file_id == -1:
+                return
+            # files with the same hash but different bytes are split into groups with their own keys
+            group_id = self.dup_groups.get_group_id(compared_file_id)
+            if group_id != -1:
+                group_key = self.dup_groups.get_group_key(group_id)
+            elif compared_file_id != compared_file_list[0]:
+                group_key = (file_size, file_hash, compared_file_id)
+        # print("FOUND DUPLICATE FILE:\n\t" + hash_group[0] + "\n\t" + file_path)
+        self._add_duplicate_file(group_key, compared_file_id, file_id)
+
+    # returns the first file with the same bytes, or -1 if there isn't one
+    # only one file of each duplicate group is compared, files can only differ if the hashes collided
+    def _verify_file(self, compared_file_list: list, file_id: int) -> int:
+        file_path = self.files.get_path(file_id)
+        compared_groups = set()
+        for compared_file_id in compared_file_list:
+            group_id = self.dup_groups.get_group_id(compared_file_id)
+            if group_id in compared_groups:
+                continue
+            if self._compare_files(compared_file_id, file_id):
+                return compared_file_id
+            print("Files have the same hash but different bytes:\n\t" +
+                  self.files.get_path(compared_file_id) + "\n\t" + file_path)
+            if group_id != -1:
+                compared_groups.add(group_id)
+        return -1
+
+    def _compare_files(self, compared_file_id: int, file_id: int) -> bool:
+        compared_file_path = self.files.get_path(compared_file_id)
+        file_path = self.files.get_path(file_id)
+        if self._hash_executor is not None:
+            files_match, bytes_read = self._hash_executor.submit(compare_files, compared_file_path, file_path,
+                                                                 self.read_blocksize).result()
         else:
-            file_list = [compared_file, duplicate_file]
-            self.duplicate_files.append(file_list)
-            # self._update_file_size_estimates(compared_file)
-            # self._update_file_size_estimates(duplicate_file)
-            
-        self._run_dup_found_callback(file_list)
-        
-    # dont use, not finished
-    # thinking of calling this whenever a file is added to the dup file list in the api
-    # instead of the ui right now
-    def _update_file_size_estimates(self, file_path: str) -> None:
-        file_size = self._get_file_size(file_path)
-        
-        for dup_list in self.duplicate_files:
-            
-            if file_path == dup_list[0]:
-                break
-            start_file_size = self._get_file_size(dup_list[0])
-            self.new_size += start_file_size
-            list_size = 0
-            for file_path in dup_list:
-                file_size = self._get_file_size(file_path)
-                list_size += file_size
-            self.total_size += list_size
-            self.space_saved += (list_size - start_file_size)
+            files_match, bytes_read = compare_files(compared_file_path, file_path, self.read_blocksize)
+        self._add_bytes_read(bytes_read)
+        return files_match
+
+    def _compare_file_list(self, file_id_list: list) -> list:
+        file_path_list = [self.files.get_path(file_id) for file_id in file_id_list]
+        if self._hash_executor is not None:
+            index_lists, bytes_read = self._hash_executor.submit(compare_file_list, file_path_list,
+                                                                 self.read_blocksize).result()
+        else:
+            index_lists, bytes_read = compare_file_list(file_path_list, self.read_blocksize)
+        self._add_bytes_read(bytes_read)
+        return index_lists
+
+    def _get_cached_hash(self, file_id: int, bytes_saved: int, full_hash: bool) -> str:
+        if self.hash_cache is None:
+            return ""
+        cached_hashes = self.hash_cache.get(self.files.get_key(file_id))
+        file_hash = cached_hashes[1] if full_hash else cached_hashes[0]
+        if file_hash:
+            self.hash_cache.add_hit(bytes_saved)
+        else:
+            self.hash_cache.add_miss()
+        return file_hash
+
+    def _set_cached_hash(self, file_id: int, partial_hash: str, full_hash: str) -> None:
+        if self.hash_cache is not None and (partial_hash or full_hash):
+            self.hash_cache.set(self.files.get_key(file_id), partial_hash, full_hash)
 
+    def get_cache_stats(self) -> dict:
+        if self.hash_cache is None:
+            return {"hits": 0, "misses": 0, "bytes_saved": 0}
+        return self.hash_cache.get_stats()
+
+    # returns the files that need to move on to the next stage
+    def _add_to_stage_group(self, stage_groups: dict, key, file_id: int) -> list:
+        with self._lock:
+            stage_group = stage_groups.setdefault(key, [])
+            stage_group.append(file_id)
+            if len(stage_group) == 1:
+                return []
+            # the first file in the group never moved on, since it had nothing to compare against
+            return stage_group[:] if len(stage_group) == 2 else [file_id]
+
+    def get_stage_counts(self) -> dict:
+        stage_counts = {}
+        with self._lock:
+            for stage, stage_groups in (("size", self.file_size_groups),
+                                        ("partial", self.partial_hash_groups),
+                                        ("full", self.full_hash_groups)):
+                group_sizes = [len(group) for group in stage_groups.values() if len(group) > 1]
+                stage_counts[stage + "_groups"] = len(group_sizes)
+                stage_counts[stage + "_files"] = sum(group_sizes)
+            # bytes in files that share a size with another file, that would all be read without the partial stage
+            stage_counts["size_group_bytes"] = sum(file_size * len(group) for file_size, group
+                                                   in self.file_size_groups.items() if len(group) > 1)
+            # same partial hash groups that were compared byte by byte instead of hashed
+            compare_group_sizes = [len(compare_group) for compare_groups in self.compare_groups.values()
+                                   if compare_groups for compare_group in compare_groups if len(compare_group) > 1]
+            stage_counts["compared_groups"] = len(compare_group_sizes)
+            stage_counts["compared_files"] = sum(compare_group_sizes)
+            stage_counts["bytes_read"] = self.bytes_read
+            stage_counts["bytes_avoided"] = max(stage_counts["size_group_bytes"] - self.bytes_read, 0)
+        return stage_counts
+
+    def _add_duplicate_file(self, group_key, compared_file_id: int, duplicate_file_id: int):
+        group_id = self.dup_groups.add(group_key, [compared_file_id, duplicate_file_id])
+        if self._dup_found_callback is not None:
+            self._run_dup_found_callback(self.dup_groups.get_paths(group_id))
+        self._add_dup_batch(group_id)
+        
     def _compare_file(self, compare_file_path: str, new_file_path: str) -> bool:
         compare_file_size = self._get_file_size(compare_file_path)
         new_file_size = self._get_file_size(new_file_path)
@@ -375,25 +1709,60 @@ class DuplicateFinder:
             return self._compare_file_hash(compare_file_path, new_file_path)
         return False
 
+    # files without a full hash yet are compared byte by byte, which can stop at the first different block
     def _compare_file_hash(self, compare_file_path: str, new_file_path: str) -> bool:
-        compare_file_hash = self.file_hash_dict[compare_file_path] \
-            if compare_file_path in self.file_hash_dict else self._make_hash(compare_file_path)
-        return compare_file_hash == self._make_hash(new_file_path)
+        compare_file_id = self.files.get_id(compare_file_path)
+        new_file_id = self.files.get_id(new_file_path)
+        if compare_file_id != -1 and new_file_id != -1 and \
+                self.files.full_hashes[compare_file_id] and self.files.full_hashes[new_file_id]:
+            return self.files.full_hashes[compare_file_id] == self.files.full_hashes[new_file_id]
+        return compare_files(compare_file_path, new_file_path, self.read_blocksize)[0]
+
+    # for files that may not have been found in the search
+    def _get_hash(self, file_path: str) -> str:
+        file_id = self.files.get_id(file_path)
+        if file_id == -1:
+            return make_hash(file_path, self.hash_algorithm)[0]
+        return self.files.full_hashes[file_id] or self._make_hash(file_id)
+
+    def _make_hash(self, file_id: int) -> str:
+        file_path = self.files.get_path(file_id)
+        if self._hash_executor is not None:
+            file_hash, bytes_read = self._hash_executor.submit(make_hash, file_path, self.hash_algorithm,
+                                                               self.read_blocksize).result()
+        else:
+            file_hash, bytes_read = make_hash(file_path, self.hash_algorithm, self.read_blocksize)
+        if file_hash:
+            self.files.full_hashes[file_id] = file_hash
+            self._add_bytes_read(bytes_read)
+        return file_hash
+
+    def _make_partial_hash(self, file_id: int, file_size: int) -> str:
+        file_path = self.files.get_path(file_id)
+        if self._hash_executor is not None:
+            partial_hash, file_hash, bytes_read = \
+                self._hash_executor.submit(make_partial_hash, file_path, file_size, self.hash_algorithm).result()
+        else:
+            partial_hash, file_hash, bytes_read = make_partial_hash(file_path, file_size, self.hash_algorithm)
+        if file_hash:
+            self.files.full_hashes[file_id] = file_hash
+        if partial_hash:
+            self.files.partial_hashes[file_id] = partial_hash
+            self._add_bytes_read(bytes_read)
+        return partial_hash
+
+    def _add_bytes_read(self, bytes_read: int) -> None:
+        with self._lock:
+            self.bytes_read += bytes_read
+
+    # bytes_hashed counts hashes that came from the cache too, it's only used for progress
+    def _add_hash_progress(self, bytes_to_hash: int, bytes_hashed: int) -> None:
+        with self._lock:
+            self.bytes_to_hash += bytes_to_hash
+            self.bytes_hashed += bytes_hashed
+        self._run_hash_progress_callback()
+        self._run_dup_batch_callback()
 
-    def _make_hash(self, file_path: str) -> str:
-        try:
-            with open(file_path, "rb") as file_io:
-                sha = hashlib.sha256()
-                file_buffer = file_io.read(BLOCKSIZE)
-                while len(file_buffer) > 0:
-                    sha.update(file_buffer)
-                    file_buffer = file_io.read(BLOCKSIZE)
-                file_hash = sha.hexdigest()
-                self.file_hash_dict[file_path] = file_hash
-                return file_hash
-        except FileNotFoundError:
-            return ""
-        
     def _make_hash_old(self, file_path: str) -> str:
         try:
             with open(file_path, "rb") as f:
@@ -401,23 +1770,27 @@ class DuplicateFinder:
                 for chunk in iter(lambda: f.read(128 * md5.block_size), b""):
                     md5.update(chunk)
                 file_hash = md5.hexdigest()
-                self.file_hash_dict[file_path] = file_hash
                 return file_hash
         except FileNotFoundError:
             return ""
         
     def _get_file_size(self, file_path: str) -> int:
-        file_size = self.file_size_dict[file_path] \
-            if file_path in self.file_size_dict else self._get_file_size_io(file_path)
-        return file_size
+        file_id = self.files.get_id(file_path)
+        return self.files.sizes[file_id] if file_id != -1 else self._get_file_size_io(file_path)
         
     def _get_file_size_io(self, file_path: str) -> int:
         if not self._check_link(file_path):
-            file_size = os.path.getsize(file_path)
-            self.file_size_dict[file_path] = file_size
-            self.total_size += file_size
-            return file_size
+            return os.path.getsize(file_path)
         return 0
+
+    # hashes from the snapshot are reused if the file key hasn't changed
+    def _load_snapshot_hashes(self, file_id: int) -> None:
+        if not self._snapshot_hashes:
+            return
+        snapshot_hashes = self._snapshot_hashes.pop(self.files.get_path(file_id), None)
+        if snapshot_hashes and tuple(snapshot_hashes[0]) == self.files.get_key(file_id):
+            self.files.partial_hashes[file_id] = snapshot_hashes[1]
+            self.files.full_hashes[file_id] = snapshot_hashes[2]
         
     def _valid_ext(self, file_path: str) -> bool:
         valid_ext = False
@@ -432,6 +1805,185 @@ class DuplicateFinder:
         return self.ignore_links and os.path.islink(file_path)
 
 
+def add_hash_algorithm(name: str, new_hash: classmethod) -> None:
+    HASH_ALGORITHMS[name] = new_hash
+
+
+# these are outside of DuplicateFinder so they can be sent to a process pool
+# returns the hash and how many bytes were read
+def make_hash(file_path: str, hash_algorithm: str = DEFAULT_HASH_ALGORITHM, blocksize: int = BLOCKSIZE) -> tuple:
+    try:
+        # unbuffered, the file is read straight into our own buffer
+        with open(file_path, "rb", buffering=0) as file_io:
+            file_hash = HASH_ALGORITHMS[hash_algorithm]()
+            bytes_read = update_hash_from_file(file_hash, file_io, blocksize)
+            return file_hash.hexdigest(), bytes_read
+    except OSError:
+        return "", 0
+
+
+# the pages read are dropped from the os cache after, so a search doesn't push out everything else in it
+def update_hash_from_file(file_hash, file_io, blocksize: int = BLOCKSIZE) -> int:
+    advise_file(file_io, "SEQUENTIAL")
+    try:
+        if os.fstat(file_io.fileno()).st_size >= MMAP_MIN_SIZE:
+            try:
+                return _update_hash_mmap(file_hash, file_io, blocksize)
+            except (OSError, ValueError):
+                pass  # some files can't be mapped, like ones on some network drives
+        return _update_hash_read(file_hash, file_io, blocksize)
+    finally:
+        advise_file(file_io, "DONTNEED")
+
+
+def _update_hash_mmap(file_hash, file_io, blocksize: int) -> int:
+    with mmap.mmap(file_io.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            file_map.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(file_map) as file_view:
+            for offset in range(0, len(file_view), blocksize):
+                file_hash.update(file_view[offset:offset + blocksize])
+        return len(file_map)
+
+
+def _update_hash_read(file_hash, file_io, blocksize: int) -> int:
+    read_buffer = get_read_buffer(blocksize)
+    bytes_read = 0
+    with memoryview(read_buffer) as read_view:
+        read_size = file_io.readinto(read_buffer)
+        while read_size:
+            file_hash.update(read_view[:read_size])
+            bytes_read += read_size
+            read_size = file_io.readinto(read_buffer)
+    return bytes_read
+
+
+_thread_buffers = local()
+
+
+# each thread keeps its buffers, so reading a file doesn't allocate new bytes for every block
+def get_read_buffer(blocksize: int, buffer_index: int = 0) -> bytearray:
+    read_buffers = getattr(_thread_buffers, "read_buffers", None)
+    if read_buffers is None:
+        read_buffers = _thread_buffers.read_buffers = {}
+    read_buffer = read_buffers.get((buffer_index, blocksize))
+    if read_buffer is None:
+        read_buffer = read_buffers[(buffer_index, blocksize)] = bytearray(blocksize)
+    return read_buffer
+
+
+# only on systems with posix_fadvise, advice is one of the names after POSIX_FADV_
+def advise_file(file_io, advice: str) -> None:
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(file_io.fileno(), 0, 0, getattr(os, "POSIX_FADV_" + advice))
+        except OSError:
+            pass
+
+
+# hashes the first and last PARTIAL_BLOCKSIZE bytes of a file,
+# small files are hashed completely, so the full hash is returned with it
+# returns the partial hash, the full hash if the whole file was read, and how many bytes were read
+def make_partial_hash(file_path: str, file_size: int, hash_algorithm: str = DEFAULT_HASH_ALGORITHM) -> tuple:
+    try:
+        with open(file_path, "rb") as file_io:
+            partial_hash = HASH_ALGORITHMS[hash_algorithm]()
+            if file_size <= PARTIAL_BLOCKSIZE * 2:
+                file_buffer = file_io.read()
+                partial_hash.update(file_buffer)
+                file_hash = partial_hash.hexdigest()
+                return file_hash, file_hash, len(file_buffer)
+            partial_hash.update(file_io.read(PARTIAL_BLOCKSIZE))
+            file_io.seek(-PARTIAL_BLOCKSIZE, os.SEEK_END)
+            partial_hash.update(file_io.read(PARTIAL_BLOCKSIZE))
+            return partial_hash.hexdigest(), "", PARTIAL_BLOCKSIZE * 2
+    except OSError:
+        return "", "", 0
+
+
+# returns if the files have the same bytes, and how many bytes were read from both
+# buffered, so readinto always fills the buffer until the end of the file and the blocks line up
+def compare_files(file_path: str, other_file_path: str, blocksize: int = BLOCKSIZE) -> tuple:
+    read_buffer = get_read_buffer(blocksize, 0)
+    other_read_buffer = get_read_buffer(blocksize, 1)
+    bytes_read = 0
+    try:
+        with open(file_path, "rb") as file_io, open(other_file_path, "rb") as other_file_io:
+            advise_file(file_io, "SEQUENTIAL")
+            advise_file(other_file_io, "SEQUENTIAL")
+            try:
+                while True:
+                    read_size = file_io.readinto(read_buffer)
+                    other_read_size = other_file_io.readinto(other_read_buffer)
+                    bytes_read += read_size + other_read_size
+                    if read_size != other_read_size:
+                        return False, bytes_read
+                    if read_size < blocksize:
+                        return read_buffer[:read_size] == other_read_buffer[:read_size], bytes_read
+                    # comparing the bytearrays is much faster than comparing memoryviews of them
+                    if read_buffer != other_read_buffer:
+                        return False, bytes_read
+            finally:
+                advise_file(file_io, "DONTNEED")
+                advise_file(other_file_io, "DONTNEED")
+    except OSError:
+        return False, bytes_read
+
+
+# returns lists of the indexes of files with the same bytes, lowest index first, and how many bytes were read
+# every file is read once, side by side a block at a time, the files in a list are split up when their blocks differ
+# and a file stops being read once no other file has the same bytes, a file that can't be read is in a list of its own
+def compare_file_list(file_path_list: list, blocksize: int = BLOCKSIZE) -> tuple:
+    index_lists = []
+    bytes_read = 0
+    with ExitStack() as file_stack:
+        file_io_list = []
+        for file_path in file_path_list:
+            try:
+                file_io = file_stack.enter_context(open(file_path, "rb"))
+                advise_file(file_io, "SEQUENTIAL")
+                file_stack.callback(advise_file, file_io, "DONTNEED")
+            except OSError:
+                file_io = None
+            file_io_list.append(file_io)
+        index_lists.extend([index] for index, file_io in enumerate(file_io_list) if file_io is None)
+        reading_lists = [[index for index, file_io in enumerate(file_io_list) if file_io is not None]]
+        while reading_lists:
+            next_reading_lists = []
+            for index_list in reading_lists:
+                if len(index_list) < 2:
+                    if index_list:
+                        index_lists.append(index_list)
+                    continue
+                same_lists = []  # (read size, indexes) for each set of files whose block was the same
+                for index in index_list:
+                    read_buffer = get_read_buffer(blocksize, index)
+                    try:
+                        read_size = file_io_list[index].readinto(read_buffer)
+                    except OSError:
+                        index_lists.append([index])
+                        continue
+                    bytes_read += read_size
+                    for same_read_size, same_index_list in same_lists:
+                        # comparing the bytearrays is much faster than comparing memoryviews of them
+                        same_buffer = get_read_buffer(blocksize, same_index_list[0])
+                        if read_size == same_read_size and (read_buffer == same_buffer if read_size == blocksize else
+                                                            read_buffer[:read_size] == same_buffer[:read_size]):
+                            same_index_list.append(index)
+                            break
+                    else:
+                        same_lists.append((read_size, [index]))
+                for read_size, same_index_list in same_lists:
+                    # a block smaller than the blocksize is the end of the files
+                    if read_size < blocksize:
+                        index_lists.append(same_index_list)
+                    else:
+                        next_reading_lists.append(same_index_list)
+            reading_lists = next_reading_lists
+    index_lists.sort()
+    return index_lists, bytes_read
+
+
 def set_sys_links(master_file: str, file_list: list) -> None:
     if not os.path.exists(master_file):
         return
@@ -458,6 +2010,21 @@ def backup_file(file_path):
     os.rename(file_path, backup_file_path)
     
                 
+# linux only, None if it isn't known, like for network drives, some virtual devices, and other systems
+# a partition doesn't have its own queue info, so it's taken from the disk it's on
+def is_rotational(device: int):
+    if not hasattr(os, "major") or not os.path.isdir("/sys/dev/block"):
+        return None
+    block_path = "/sys/dev/block/" + str(os.major(device)) + ":" + str(os.minor(device))
+    for rotational_path in (block_path + "/queue/rotational", block_path + "/../queue/rotational"):
+        try:
+            with open(rotational_path, "r") as rotational_io:
+                return rotational_io.read().strip() == "1"
+        except OSError:
+            pass
+    return None
+
+
 def is_junction(path: str) -> bool:
     try:
         if os.path.isdir(path):
@@ -466,6 +2033,13 @@ def is_junction(path: str) -> bool:
         return False
 
 
+def is_junction_entry(dir_entry: os.DirEntry) -> bool:
+    # DirEntry.is_junction was added in python 3.12, and junctions only exist on windows
+    if hasattr(dir_entry, "is_junction"):
+        return dir_entry.is_junction()
+    return os.name == "nt" and is_junction(dir_entry.path)
+
+
 def get_date_modified(file_path: str) -> float:
     if os.name == "nt":
         if os.path.isfile(file_path):
@@ -488,3 +2062,109 @@ def replace_date_modifed(file_path: str, mod_time: float) -> bool:
     except FileNotFoundError:
         return False
 
+
+
+# options for any front end that runs a search, each front end can add its own before parsing
+def get_arg_parser() -> argparse.ArgumentParser:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--directories", '-d', required=True, nargs="+", help="directories to search")
+    arg_parser.add_argument("--exclude", '-ed', default=[], nargs="+", help="directories to exclude")
+    arg_parser.add_argument("--ext", '-e', default=[], nargs="+", help="only check files with these extensions")
+    arg_parser.add_argument("--ignore_ext", '-i', default=[], nargs="+", help="file extensions to exclude")
+    arg_parser.add_argument("--cache", '-c', default="", help="sqlite file to keep file hashes in between scans")
+    arg_parser.add_argument("--cache_max_age", default=30.0, type=float,
+                            help="days to keep a cached hash for a file that hasn't been seen in a scan")
+    arg_parser.add_argument("--search_workers", default=8, type=int,
+                            help="how many directories to search at the same time")
+    arg_parser.add_argument("--hash_workers", '-w', default=os.cpu_count() or 4, type=int,
+                            help="how many files to hash at the same time")
+    arg_parser.add_argument("--hash_backend", default="thread", choices=["thread", "process"],
+                            help="hash files in threads or in separate processes")
+    arg_parser.add_argument("--count_first", action="store_true",
+                            help="count every file before searching, instead of using the count from the last search")
+    arg_parser.add_argument("--hdd_workers", default=1, type=int,
+                            help="files hashed at the same time on each spinning disk")
+    arg_parser.add_argument("--ssd_workers", default=0, type=int,
+                            help="files hashed at the same time on each ssd or unknown device, 0 for --hash_workers")
+    arg_parser.add_argument("--device_workers", default=[], nargs="+",
+                            help="PATH=WORKERS, files hashed at the same time on the device that PATH is on")
+    arg_parser.add_argument("--hash_algorithm", default=DEFAULT_HASH_ALGORITHM,
+                            choices=sorted(set(HASH_ALGORITHMS) | {"xxh3"}),
+                            help="hash used to find duplicates, xxh3 needs the xxhash module, "
+                                 "cached hashes from another algorithm aren't used")
+    arg_parser.add_argument("--read_blocksize", default=BLOCKSIZE, type=int,
+                            help="bytes read at a time to hash or compare whole files")
+    arg_parser.add_argument("--compare_max_files", default=3, type=int,
+                            help="files with the same size and partial hash that are compared byte by byte "
+                                 "instead of hashed, 0 to always hash")
+    arg_parser.add_argument("--compare_min_size", default=1048576, type=int,
+                            help="smallest file size in bytes to compare byte by byte instead of hashing")
+    arg_parser.add_argument("--verify", action="store_true",
+                            help="compare duplicates byte by byte before they're added, after the hashes match")
+    arg_parser.add_argument("--apply_workers", default=APPLY_WORKERS, type=int,
+                            help="how many groups of duplicates to link or delete at the same time")
+    arg_parser.add_argument("--apply_journal", default="",
+                            help="file to write each apply operation to, so an interrupted apply can be resumed "
+                                 "or rolled back with apply_engine.py")
+    arg_parser.add_argument("--skip_apply_verify", action="store_true",
+                            help="on apply, don't check if duplicates changed since the search before changing them")
+    arg_parser.add_argument("--images", action="store_true",
+                            help="group images that look the same instead of having the same bytes, "
+                                 "the images checked are the files found with --ext, or common image types, "
+                                 "they can't be linked, only deleted, needs the numpy and pillow modules")
+    arg_parser.add_argument("--image_hash", default=DEFAULT_IMAGE_HASH, choices=sorted(IMAGE_HASH_SIZES),
+                            help="perceptual hash used for --images")
+    arg_parser.add_argument("--image_distance", default=DEFAULT_IMAGE_DISTANCE, type=int,
+                            help="bits out of 64 the perceptual hashes of images can differ by to be grouped")
+    arg_parser.add_argument("--snapshot", default="", help="json file to save the search to, for --incremental")
+    arg_parser.add_argument("--incremental", action="store_true",
+                            help="only list directories that changed since the --snapshot was saved, "
+                                 "files in the others are still checked for changes")
+    return arg_parser
+
+
+def parse_args(arg_parser: argparse.ArgumentParser = None) -> argparse.Namespace:
+    if arg_parser is None:
+        arg_parser = get_arg_parser()
+    args = arg_parser.parse_args()
+    if args.incremental and not args.snapshot:
+        arg_parser.error("--incremental needs a --snapshot file")
+    if args.images and not can_hash_images():
+        arg_parser.error("--images needs the numpy and pillow modules")
+    device_workers = {}
+    for device_arg in args.device_workers:
+        device_path, _, workers = device_arg.rpartition("=")
+        if not device_path or not workers.isdigit():
+            arg_parser.error("--device_workers needs PATH=WORKERS, not: " + device_arg)
+        device_workers[device_path] = int(workers)
+    args.device_workers = device_workers
+    return args
+
+
+def set_search_args(dup_finder: DuplicateFinder, args: argparse.Namespace) -> None:
+    [dup_finder.add_search_dir(arg) for arg in args.directories]
+    [dup_finder.add_exclude_dir(arg) for arg in args.exclude]
+    [dup_finder.add_exclude_ext(arg) for arg in args.ignore_ext]
+    [dup_finder.add_ext(arg) for arg in args.ext]
+    dup_finder.cache_path = args.cache
+    dup_finder.cache_max_age = args.cache_max_age
+    dup_finder.search_workers = args.search_workers
+    dup_finder.hash_workers = args.hash_workers
+    dup_finder.hash_backend = args.hash_backend
+    dup_finder.hash_algorithm = args.hash_algorithm
+    dup_finder.hdd_workers = args.hdd_workers
+    dup_finder.ssd_workers = args.ssd_workers
+    dup_finder.device_workers = args.device_workers
+    dup_finder.verify_bytes = args.verify
+    dup_finder.compare_max_files = args.compare_max_files
+    dup_finder.compare_min_size = args.compare_min_size
+    dup_finder.read_blocksize = max(args.read_blocksize, PARTIAL_BLOCKSIZE)
+    dup_finder.count_files_first = args.count_first
+    dup_finder.apply_workers = args.apply_workers
+    dup_finder.apply_journal_path = args.apply_journal
+    dup_finder.verify_before_apply = not args.skip_apply_verify
+    dup_finder.image_mode = args.images
+    dup_finder.image_hash = args.image_hash
+    dup_finder.image_distance = args.image_distance
+    dup_finder.snapshot_path = args.snapshot
+    dup_finder.incremental = args.incremental
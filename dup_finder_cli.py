@@ -0,0 +1,203 @@
+import sys
+import csv
+import json
+import argparse
+from enum import Enum
+from threading import Thread, Lock
+from contextlib import redirect_stdout
+from dup_finder import DuplicateFinder, FileMarks, IMAGE_GROUP, get_arg_parser, parse_args, set_search_args
+from similarity import CHUNK_AVG_SIZE
+
+# runs a search without the gui, for scripts and cron
+# duplicates are written while the search runs, one line for each file, as soon as its group has it
+# confirmed says how the files of a group were found to be the same: "hash" if their hashes matched,
+# "compare" if their bytes were compared, which leaves hash empty, or "image" if they look the same
+# exit code is 0 if no duplicates were found and 1 if they were, 130 if the search was stopped
+# argparse already exits with 2 for bad arguments
+
+EXIT_NO_DUPLICATES = 0
+EXIT_DUPLICATES = 1
+EXIT_ERROR = 2
+EXIT_STOPPED = 130
+
+CSV_HEADER = ["group", "path", "size", "hash", "confirmed", "mark"]
+SIMILAR_CSV_HEADER = ["similarity", "path", "other_path", "shared_bytes"]
+MARK_NAMES = {"master": FileMarks.MASTER, "link": FileMarks.LINK,
+              "delete": FileMarks.DELETE, "ignore": FileMarks.IGNORE,
+              "hardlink": FileMarks.HARDLINK, "reflink": FileMarks.REFLINK}
+
+
+def parse_cli_args() -> argparse.Namespace:
+    arg_parser = get_arg_parser()
+    arg_parser.add_argument("--format", '-f', default="jsonl", choices=["jsonl", "csv"],
+                            help="how to write each duplicate file")
+    arg_parser.add_argument("--output", '-o', default="", help="file to write duplicates to instead of stdout")
+    arg_parser.add_argument("--master_mark", default="master", choices=["master", "delete", "ignore"],
+                            help="mark for the first file found in a duplicate group")
+    arg_parser.add_argument("--dup_mark", default="ignore",
+                            choices=["link", "hardlink", "reflink", "delete", "ignore"],
+                            help="mark for every other file in a duplicate group, "
+                                 "reflink falls back to hardlink, and hardlink to link, if it can't be made")
+    arg_parser.add_argument("--apply", action="store_true",
+                            help="link or delete the duplicates by their marks after the search finishes")
+    arg_parser.add_argument("--keep_date", action="store_true",
+                            help="on apply, don't set the date modified of the master file to the oldest one")
+    arg_parser.add_argument("--similar", default=0.0, type=float,
+                            help="after the search, find files that share at least this percent of their bytes, "
+                                 "like vm images with other headers, 0 to not look for them")
+    arg_parser.add_argument("--similar_min_size", default=1048576, type=int,
+                            help="smallest file size in bytes to check for similar files")
+    arg_parser.add_argument("--chunk_size", default=CHUNK_AVG_SIZE, type=int,
+                            help="average size in bytes of the chunks files are cut into to find similar files")
+    arg_parser.add_argument("--similar_output", default="",
+                            help="file to write similar files to, instead of after the duplicates in --output")
+    args = parse_args(arg_parser)
+    if args.similar > 0 and args.format == "csv" and not args.similar_output:
+        arg_parser.error("--similar with --format csv needs a --similar_output file")
+    if args.dup_mark in ("link", "hardlink", "reflink") and args.master_mark != "master":
+        arg_parser.error("--dup_mark " + args.dup_mark + " needs a master file to link to, with --master_mark master")
+    return args
+
+
+# groups of compared files are keyed (size, "", first file id), since they never got a full hash
+def get_confirmed(group_key) -> str:
+    if group_key and group_key[0] == IMAGE_GROUP:
+        return "image"
+    if group_key and len(group_key) == 3 and group_key[1] == "":
+        return "compare"
+    return "hash"
+
+
+# sets the marks of new files the same way the gui does by default, and writes them
+# only the number of files already written is kept for each group, not the files
+class DuplicateWriter:
+    def __init__(self, dup_finder: DuplicateFinder, output_io, output_format: str,
+                 master_mark: Enum, dup_mark: Enum):
+        self._dup_finder = dup_finder
+        self._output_io = output_io
+        self._master_mark = master_mark
+        self._dup_mark = dup_mark
+        self._csv_writer = None
+        self._written = {}  # key is group id, value is how many files of the group were written
+        self._lock = Lock()
+        self.files_written = 0
+        if output_format == "csv":
+            self._csv_writer = csv.writer(output_io)
+            self._csv_writer.writerow(CSV_HEADER)
+
+    def write_batch(self, dup_batch: dict) -> None:
+        files = self._dup_finder.files
+        with self._lock:
+            for group_id, dup_file_list in dup_batch.items():
+                group_key = self._dup_finder.dup_groups.get_group_key(group_id)
+                file_hash = group_key[1] if group_key else ""
+                confirmed = get_confirmed(group_key)
+                for index in range(self._written.get(group_id, 0), len(dup_file_list)):
+                    file_id = files.get_id(dup_file_list[index])
+                    if file_id == -1:
+                        continue
+                    if files.links[file_id]:
+                        file_mark = FileMarks.IGNORE
+                    elif index == 0:
+                        file_mark = self._master_mark
+                    else:
+                        file_mark = self._dup_mark
+                    files.set_mark(file_id, file_mark)
+                    # images can't be marked to be linked, they are set to ignore instead
+                    file_mark = files.get_mark(file_id)
+                    self._write_file(group_id, dup_file_list[index], files.sizes[file_id], file_hash, confirmed,
+                                     file_mark)
+                self._written[group_id] = len(dup_file_list)
+            self._output_io.flush()
+
+    def _write_file(self, group_id: int, file_path: str, file_size: int, file_hash: str, confirmed: str,
+                    file_mark: Enum) -> None:
+        if self._csv_writer is not None:
+            self._csv_writer.writerow([group_id, file_path, file_size, file_hash, confirmed, file_mark.name.lower()])
+        else:
+            self._output_io.write(json.dumps({"group": group_id, "path": file_path, "size": file_size,
+                                              "hash": file_hash, "confirmed": confirmed,
+                                              "mark": file_mark.name.lower()}) + "\n")
+        self.files_written += 1
+
+
+# one line for each pair of files, most similar first
+def write_similar_files(similar_files: list, output_io, output_format: str) -> None:
+    if output_format == "csv":
+        csv_writer = csv.writer(output_io)
+        csv_writer.writerow(SIMILAR_CSV_HEADER)
+        for file_path, other_file_path, shared_bytes, similarity in similar_files:
+            csv_writer.writerow(["%.2f" % similarity, file_path, other_file_path, shared_bytes])
+    else:
+        for file_path, other_file_path, shared_bytes, similarity in similar_files:
+            output_io.write(json.dumps({"similarity": round(similarity, 2), "path": file_path,
+                                        "other_path": other_file_path, "shared_bytes": shared_bytes}) + "\n")
+    output_io.flush()
+
+
+def run_search(args: argparse.Namespace, output_io) -> int:
+    dup_finder = DuplicateFinder()
+    set_search_args(dup_finder, args)
+    if not dup_finder.search_directory_list:
+        print("No directories to search", file=sys.stderr)
+        return EXIT_ERROR
+    dup_finder.use_oldest_mod_date = not args.keep_date
+    dup_finder.similar_min_percent = args.similar
+    dup_finder.similar_min_size = args.similar_min_size
+    dup_finder.chunk_avg_size = max(args.chunk_size, 256)
+    writer = DuplicateWriter(dup_finder, output_io, args.format,
+                             MARK_NAMES[args.master_mark], MARK_NAMES[args.dup_mark])
+    dup_finder.set_dup_batch_callback(writer.write_batch)
+
+    # the search runs in another thread so ctrl+c can stop it here
+    search_thread = Thread(target=dup_finder.start_search)
+    search_thread.start()
+    try:
+        while search_thread.is_alive():
+            search_thread.join(0.25)
+    except KeyboardInterrupt:
+        print("Stopping search", file=sys.stderr)
+        dup_finder.stop()
+        search_thread.join()
+        return EXIT_STOPPED
+
+    print("Duplicate files: " + str(dup_finder.get_duplicate_file_count()) +
+          " in " + str(len(dup_finder.dup_groups)) + " groups, " +
+          "space saved by marks: " + str(dup_finder.space_saved) + " bytes", file=sys.stderr)
+    if dup_finder.similar_files:
+        if args.similar_output:
+            try:
+                with open(args.similar_output, "w", encoding="utf-8", newline="") as similar_io:
+                    write_similar_files(dup_finder.similar_files, similar_io, args.format)
+            except OSError as F:
+                print("Unable to write similar files: " + args.similar_output + "\n" + str(F))
+                return EXIT_ERROR
+        else:
+            write_similar_files(dup_finder.similar_files, output_io, args.format)
+    if args.apply:
+        try:
+            if not dup_finder.apply():
+                return EXIT_ERROR
+        except KeyboardInterrupt:
+            print("Stopping apply", file=sys.stderr)
+            return EXIT_STOPPED
+    return EXIT_DUPLICATES if writer.files_written else EXIT_NO_DUPLICATES
+
+
+def main() -> int:
+    args = parse_cli_args()
+    stdout_io = sys.stdout
+    # anything the finder prints goes to stderr, so stdout only has the duplicates
+    with redirect_stdout(sys.stderr):
+        if not args.output:
+            return run_search(args, stdout_io)
+        try:
+            with open(args.output, "w", encoding="utf-8", newline="") as output_io:
+                return run_search(args, output_io)
+        except OSError as F:
+            print("Unable to write output: " + args.output + "\n" + str(F))
+            return EXIT_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,11 @@ import datetime
 import argparse
 import webbrowser
 from enum import Enum
-from time import perf_counter
+from array import array
+from bisect import bisect_right
 from threading import Thread
-from dup_finder import DuplicateFinder, File, FileMarks, is_junction
+from dup_finder import DuplicateFinder, File, FileMarks, LINK_MARK_OPS, is_junction, get_arg_parser, set_search_args
+from dup_finder import parse_args as parse_search_args
 
 # for pycharm, install pyqt5-stubs, so you don't get 10000 errors for no reason
 from PyQt5.QtWidgets import *
@@ -15,20 +17,21 @@ from PyQt5.QtCore import *
 
 
 def parse_args() -> argparse.Namespace:
-    arg_parser = argparse.ArgumentParser()
-    arg_parser.add_argument("--directories", '-d', required=True, nargs="+", help="directories to search")
-    arg_parser.add_argument("--exclude", '-ed', default=[], nargs="+", help="directories to exclude")
-    arg_parser.add_argument("--ext", '-e', default=[], nargs="+", help="only check files with these extensions")
-    arg_parser.add_argument("--ignore_ext", '-i', default=[], nargs="+", help="file extensions to exclude")
-    return arg_parser.parse_args()
+    arg_parser = get_arg_parser()
+    arg_parser.add_argument("--progress_bytes", action="store_true",
+                            help="show progress in bytes left to hash instead of files found")
+    return parse_search_args(arg_parser)
 
 
 class MainWindow(QWidget):
     # dup file found?
-    sig_dup_found = pyqtSignal(list)
+    sig_dup_batch = pyqtSignal(dict)
     sig_file_scanned = pyqtSignal(int)
+    sig_total_files = pyqtSignal(int)
+    sig_hash_progress = pyqtSignal(object, object)  # can go past the max of an int
     sig_finished = pyqtSignal()
     sig_apply = pyqtSignal(File, list)
+    sig_verified = pyqtSignal()
     
     def __init__(self):
         super().__init__()
@@ -36,7 +39,6 @@ class MainWindow(QWidget):
         self.setWindowTitle("Duplicate File Finder")
         self.dup_finder = DuplicateFinder()
         self.dup_finder_threads = []
-        self.dup_files_added_to_list = []
         
         self.progress_bar = QProgressBar()
         
@@ -56,6 +58,9 @@ class MainWindow(QWidget):
         
         help_master = "Files marked as Link point to this file"
         help_link = "Create a system link pointing to the Master file"
+        help_hardlink = "Create a hardlink to the Master file,\na system link if it's on another drive"
+        help_reflink = "Create a copy of the Master file that shares its space on disk (btrfs, xfs),\n" \
+                       "a hardlink or system link if the drive can't"
         help_delete = "Delete the file"
         help_ignore = "Don't do anything with the file"
         
@@ -81,13 +86,19 @@ class MainWindow(QWidget):
         self.file_mark_dup_button_group.setToolTip("What any file added to an existing duplicate file list will be set to on apply")
         file_mark_dup_layout = QVBoxLayout()
         self.file_mark_dup_link = QRadioButton("Link")
+        self.file_mark_dup_hardlink = QRadioButton("Hardlink")
+        self.file_mark_dup_reflink = QRadioButton("Reflink")
         self.file_mark_dup_del = QRadioButton("Delete")
         self.file_mark_dup_ignore = QRadioButton("Ignore")
         self.file_mark_dup_link.setChecked(True)
         self.file_mark_dup_link.setToolTip(help_link)
+        self.file_mark_dup_hardlink.setToolTip(help_hardlink)
+        self.file_mark_dup_reflink.setToolTip(help_reflink)
         self.file_mark_dup_del.setToolTip(help_delete)
         self.file_mark_dup_ignore.setToolTip(help_ignore)
         file_mark_dup_layout.addWidget(self.file_mark_dup_link)
+        file_mark_dup_layout.addWidget(self.file_mark_dup_hardlink)
+        file_mark_dup_layout.addWidget(self.file_mark_dup_reflink)
         file_mark_dup_layout.addWidget(self.file_mark_dup_del)
         file_mark_dup_layout.addWidget(self.file_mark_dup_ignore)
         self.file_mark_dup_button_group.setLayout(file_mark_dup_layout)
@@ -111,8 +122,12 @@ class MainWindow(QWidget):
         self.label_total_size = QLabel("Total Size: 0.0 MB")
         self.label_new_size = QLabel("New Size: 0.0 MB")
         self.label_space_saved = QLabel("Space Saved: 0.0 MB")
-        self.file_list = FileList()
+        self.label_hardlinks = QLabel("Already Hardlinked: 0 (0.0 MB)")
+        self.label_hardlinks.setToolTip("Extra paths to a file that was already found, these aren't hashed or counted")
+        self.file_list = FileList(self.dup_finder)
         self.list_dup_files = QTreeView()
+        self.list_dup_files.setUniformRowHeights(True)
+        self.list_dup_files.setRootIsDecorated(False)
         self.list_dup_files.setModel(self.file_list)
         header = self.list_dup_files.header()
         header.setSectionResizeMode(0, QHeaderView.Stretch)
@@ -122,10 +137,14 @@ class MainWindow(QWidget):
         header.resizeSection(3, min_size)
         header.resizeSection(4, min_size)
         header.resizeSection(5, min_size)
+        header.resizeSection(6, min_size)
+        header.resizeSection(7, min_size)
         header.setSectionResizeMode(2, QHeaderView.Fixed)
         header.setSectionResizeMode(3, QHeaderView.Fixed)
         header.setSectionResizeMode(4, QHeaderView.Fixed)
         header.setSectionResizeMode(5, QHeaderView.Fixed)
+        header.setSectionResizeMode(6, QHeaderView.Fixed)
+        header.setSectionResizeMode(7, QHeaderView.Fixed)
         header.setStretchLastSection(False)
         
         self.list_dup_files_layout = QHBoxLayout()
@@ -148,6 +167,7 @@ class MainWindow(QWidget):
         self.layout().addWidget(self.label_total_size)
         self.layout().addWidget(self.label_new_size)
         self.layout().addWidget(self.label_space_saved)
+        self.layout().addWidget(self.label_hardlinks)
         
         self.layout().addWidget(list_dup_files_layout_widget)
         self.list_dup_files_layout.addWidget(self.list_dup_files)
@@ -168,25 +188,26 @@ class MainWindow(QWidget):
         self.dup_file_btns_layout.addStretch(1)
         self.dup_file_btns_layout.addWidget(self.button_apply)
         
-        [self.dup_finder.add_search_dir(arg) for arg in ARGS.directories]
-        [self.dup_finder.add_exclude_dir(arg) for arg in ARGS.exclude]
-        [self.dup_finder.add_exclude_ext(arg) for arg in ARGS.ignore_ext]
-        [self.dup_finder.add_ext(arg) for arg in ARGS.ext]
+        set_search_args(self.dup_finder, ARGS)
         
-        self.sig_dup_found.connect(self.dup_file_found)
+        self.sig_dup_batch.connect(self.dup_batch_found)
         self.sig_file_scanned.connect(self.file_scanned)
+        self.sig_total_files.connect(self.total_files_changed)
+        self.sig_hash_progress.connect(self.hash_progress)
         self.sig_finished.connect(self.scan_finished)
+        self.sig_verified.connect(self.apply_verified)
         self.sig_apply.connect(self.file_list.apply_callback)
         
         self.dup_finder.set_file_scanned_callback(self.file_scanned_emit)
-        self.dup_finder.set_dup_found_callback(self.dup_file_found_emit)
+        self.dup_finder.set_total_files_callback(self.total_files_emit)
+        if ARGS.progress_bytes:
+            self.dup_finder.set_hash_progress_callback(self.hash_progress_emit)
+        self.dup_finder.set_dup_batch_callback(self.dup_batch_found_emit)
         self.dup_finder.set_scan_finished_callback(self.scan_finished_emit)
         self.dup_finder.set_apply_callback(self.apply_emit)
 
         self.total_file_count = 0
         self.label_total_files.setText("Total Files: " + str(self.total_file_count))
-        self.color_2 = False
-        self.bg_color = QColor("#e6e6e6")  # QColor("#d9d9d9")
         
         self.show()
     
@@ -198,20 +219,17 @@ class MainWindow(QWidget):
     @pyqtSlot()
     def toggle_search(self) -> None:
         if self.button_start.text() == "Start":
-            # self.file_list.model.removeRows(0, self.file_list.model.rowCount())
             self.file_list.reset()
-            self.dup_files_added_to_list = []
             self.button_apply.setDisabled(False)
             self.button_apply.setToolTip("")
             self.label_dups_found.setText("Duplicate Files Found: 0")
             self.label_total_size.setText("Total Size: 0.0 MB")
             self.label_new_size.setText("New Size: 0.0 MB")
             self.label_space_saved.setText("Space Saved: 0.0 MB")
+            self.label_hardlinks.setText("Already Hardlinked: 0 (0.0 MB)")
             self.dup_finder.reset()
-            self.total_file_count = self.dup_finder.get_total_file_count()
-            self.label_total_files.setText("Total Files: " + str(self.total_file_count))
             self.progress_bar.setValue(0)
-            self.progress_bar.setMaximum(self.total_file_count)
+            self.progress_bar.setMaximum(0)
             dup_finder_thread = Thread(target=self.dup_finder.start_search)
             dup_finder_thread.start()
             self.dup_finder_threads.append(dup_finder_thread)
@@ -224,7 +242,6 @@ class MainWindow(QWidget):
                 if not thread.is_alive():
                     thread.join()
             self.dup_finder_threads = []
-            # self.dup_files_added_to_list = []
             self.button_start.setText("Start")
     
     # TODO: have this select the file in file explorer if windows
@@ -243,9 +260,31 @@ class MainWindow(QWidget):
     
     @pyqtSlot()
     def apply(self) -> None:
-        self.dup_finder.apply()
         self.button_apply.setDisabled(True)
         self.button_apply.setToolTip("Need to rescan, doesn't update the list yet")
+        if not self.dup_finder.verify_before_apply:
+            self.start_apply()
+            return
+        # files that changed since the search are taken out of their groups first, then the list is made again
+        verify_thread = Thread(target=self.run_verify)
+        verify_thread.start()
+        self.dup_finder_threads.append(verify_thread)
+
+    def run_verify(self) -> None:
+        self.dup_finder.verify_groups()
+        self.sig_verified.emit()
+
+    @pyqtSlot()
+    def apply_verified(self) -> None:
+        self.file_list.refresh_groups()
+        self.scan_update()
+        self.start_apply()
+
+    # files are updated in the list through the apply callback as they're done
+    def start_apply(self) -> None:
+        apply_thread = Thread(target=self.dup_finder.apply, args=(False, ))
+        apply_thread.start()
+        self.dup_finder_threads.append(apply_thread)
 
     @pyqtSlot()
     def check_ignore_links_changed(self) -> None:
@@ -273,12 +312,16 @@ class MainWindow(QWidget):
         return self.get_selected_item().path
     
     def file_scanned_emit(self, files_scanned: int) -> None:
-        if files_scanned >= self.total_file_count:
-            print("hold up")
         self.sig_file_scanned.emit(files_scanned)
     
-    def dup_file_found_emit(self, dup_file_list: list) -> None:
-        self.sig_dup_found.emit(dup_file_list)
+    def total_files_emit(self, total_file_count: int) -> None:
+        self.sig_total_files.emit(total_file_count)
+    
+    def hash_progress_emit(self, bytes_hashed: int, bytes_to_hash: int) -> None:
+        self.sig_hash_progress.emit(bytes_hashed, bytes_to_hash)
+    
+    def dup_batch_found_emit(self, dup_batch: dict) -> None:
+        self.sig_dup_batch.emit(dup_batch)
     
     def scan_finished_emit(self) -> None:
         self.sig_finished.emit()
@@ -298,300 +341,273 @@ class MainWindow(QWidget):
     def _get_def_dup_mark(self) -> Enum:
         if self.file_mark_dup_link.isChecked():
             return FileMarks.LINK
+        elif self.file_mark_dup_hardlink.isChecked():
+            return FileMarks.HARDLINK
+        elif self.file_mark_dup_reflink.isChecked():
+            return FileMarks.REFLINK
         elif self.file_mark_dup_del.isChecked():
             return FileMarks.DELETE
         elif self.file_mark_dup_ignore.isChecked():
             return FileMarks.IGNORE
         return FileMarks.IGNORE
         
-    def dup_file_found(self, dup_file_list: list) -> None:
-        start = perf_counter()
-        for dup_file in dup_file_list:
-            if dup_file not in self.dup_files_added_to_list:
-                # start = perf_counter()
-                # is_link = os.path.islink(dup_file)
-                # if not ARGS.no_defaults and not os.path.islink(dup_file):
-                
-                ass = self._get_def_mark()
-                if not os.path.islink(dup_file):
-                    # file_state = FileMarks.MASTER if dup_file_list.index(dup_file) == 0 else ARGS.file_mark_dup
-                    file_state = self._get_def_mark() if not dup_file_list.index(dup_file) else self._get_def_dup_mark()
-                else:
+    # the new files in a group are the ones after the files already shown,
+    # their marks are set before they're added so the rows only need to be drawn once
+    def dup_batch_found(self, dup_batch: dict) -> None:
+        files = self.dup_finder.files
+        def_mark = self._get_def_mark()
+        def_dup_mark = self._get_def_dup_mark()
+        for group_id, dup_file_list in dup_batch.items():
+            for index in range(self.file_list.get_group_file_count(group_id), len(dup_file_list)):
+                file_id = files.get_id(dup_file_list[index])
+                if file_id == -1:
+                    continue
+                if files.links[file_id]:
                     file_state = FileMarks.IGNORE
-                    
-                for added_dup_file_widget_index in range(0, self.file_list.rowCount()):
-                    added_dup_file_widget_item = self.file_list.get_file_obj_row(added_dup_file_widget_index)
-                    if added_dup_file_widget_item.path in dup_file_list:
-                        self.file_list.insert_item(added_dup_file_widget_index, dup_file, file_state)
-                        break
+                elif index == 0:
+                    file_state = def_mark
                 else:
-                    # TODO: maybe check for more variety between colors, so we don't get too similar ones?
-                    '''
-                    if self.list_dup_files.count():
-                        prev_item = self.list_dup_files.item(self.list_dup_files.count() - 1)
-                        prev_color = prev_item.background().color().name()
-                        while True:
-                            hex_color = random_color()
-                            # if hex_color != prev_color:
-                            if not are_colors_too_similar(hex_color, prev_color):
-                                break
-                    else:
-                        hex_color = random_color()
-                    dup_file_widget_item.setBackground(QColor(hex_color))
-                    '''
-                    # start = perf_counter()
-                    if self.color_2:
-                        self.file_list.add_item(dup_file, file_state, self.bg_color)
-                    else:
-                        self.file_list.add_item(dup_file, file_state)
-                    # print("time: " + str(perf_counter() - start))
-                    self.color_2 = not self.color_2
-                self.dup_files_added_to_list.append(dup_file)
-        
+                    file_state = def_dup_mark
+                files.set_mark(file_id, file_state)
+        self.file_list.add_batch(dup_batch)
         self.scan_update()
-        print("dup file found time: " + str(perf_counter() - start))
         
     def scan_update(self) -> None:
         self.label_dups_found.setText("Duplicate Files Found: " + str(self.dup_finder.get_duplicate_file_count()))
-        self.dup_finder.update_size_estimates()
         self.label_total_size.setText("Total Size: " + str(bytes_to_megabytes(self.dup_finder.total_size)) + " MB")
         self.label_new_size.setText("New Size: " + str(bytes_to_megabytes(self.dup_finder.new_size)) + " MB")
         self.label_space_saved.setText("Space Saved: " + str(bytes_to_megabytes(self.dup_finder.space_saved)) + " MB")
+        self.label_hardlinks.setText("Already Hardlinked: " + str(self.dup_finder.get_hardlink_file_count()) +
+                                     " (" + str(bytes_to_megabytes(self.dup_finder.hardlink_size)) + " MB)")
     
     def file_scanned(self, files_scanned: int) -> None:
-        self.progress_bar.setValue(files_scanned)
+        if not ARGS.progress_bytes:
+            self.progress_bar.setValue(files_scanned)
         self.label_files_scanned.setText("Files Scanned: " + str(files_scanned))
+    
+    # the total goes up during the search if there was no count from a previous search, or it was lower
+    def total_files_changed(self, total_file_count: int) -> None:
+        self.total_file_count = total_file_count
+        self.label_total_files.setText("Total Files: " + str(total_file_count))
+        if not ARGS.progress_bytes:
+            self.progress_bar.setMaximum(total_file_count)
+    
+    # in megabytes, since the progress bar only takes an int
+    def hash_progress(self, bytes_hashed: int, bytes_to_hash: int) -> None:
+        self.progress_bar.setMaximum(bytes_to_hash // 1048576)
+        self.progress_bar.setValue(bytes_hashed // 1048576)
         
     def scan_finished(self) -> None:
-        self.file_scanned(self.progress_bar.maximum())
+        self.progress_bar.setMaximum(max(self.progress_bar.maximum(), 1))
+        self.progress_bar.setValue(self.progress_bar.maximum())
+        self.label_files_scanned.setText("Files Scanned: " + str(len(self.dup_finder.found_file_list)))
         self.scan_update()
         self.button_start.setText("Start")
 
 
-class FileCheckBox(QStandardItem):
-    def __init__(self):
-        super().__init__()
-        # so we don't hit a recursion error right after checking something
-        # since on_check_change is called every time we change the state of a checkbox
-        self.recurse_check = False
-        self.setCheckable(True)
-        self.setEditable(False)
-
-
-class FileList(QSortFilterProxyModel):
-    def __init__(self):
+# rows are read from the duplicate groups of the finder when the view asks for them, nothing is stored per row
+# groups are shown in the order they were first found, with each group's rows kept together
+class FileList(QAbstractTableModel):
+    def __init__(self, dup_finder: DuplicateFinder):
         super().__init__()
-        self.model = QStandardItemModel()
-        self.setSourceModel(self.model)
-        self.model.itemChanged.connect(self.on_check_change)
+        self._dup_finder = dup_finder
         self._check_master = 3
         self._check_link = 4
         self._check_del = 5
-        self.model.setColumnCount(self._check_del)
-        self.model.setHorizontalHeaderItem(0, QStandardItem("File Path"))
-        self.model.setHorizontalHeaderItem(1, QStandardItem("File Size"))
-        # self.model.setHorizontalHeaderItem(2, QStandardItem("File Extension"))
-        self.model.setHorizontalHeaderItem(2, QStandardItem("Is Link"))
-        self.model.setHorizontalHeaderItem(self._check_master, QStandardItem("M"))
-        self.model.setHorizontalHeaderItem(self._check_link, QStandardItem("L"))
-        self.model.setHorizontalHeaderItem(self._check_del, QStandardItem("D"))
-        ass = self.model.horizontalHeaderItem(0)
-        print("uhhh")
+        self._check_hardlink = 6
+        self._check_reflink = 7
+        self._headers = ["File Path", "File Size", "Is Link", "M", "L", "D", "H", "R"]
+        self._column_marks = {self._check_master: FileMarks.MASTER,
+                              self._check_link: FileMarks.LINK,
+                              self._check_del: FileMarks.DELETE,
+                              self._check_hardlink: FileMarks.HARDLINK,
+                              self._check_reflink: FileMarks.REFLINK}
+        self.bg_color = QColor("#e6e6e6")  # QColor("#d9d9d9")
+        self._group_ids = []  # group ids in the order they are shown
+        self._group_pos = {}  # key is group id, value is its index in _group_ids
+        self._group_sizes = array("L")  # files shown for each group, the group can have more that aren't shown yet
+        self._group_rows = array("q")  # first row of each group
+        self._group_rows_valid = 0  # _group_rows is only up to date before this index
+        self._row_count = 0
         
     def reset(self) -> None:
-        self.model.removeRows(0, self.model.rowCount())
-
-    def apply_callback(self, file_obj: File, dup_list: list) -> None:
-        item = self.get_file_item(file_obj.path)
-        
-        if file_obj.get_mark() == FileMarks.MASTER:
-            pass
-        elif file_obj.get_mark() == FileMarks.LINK:
-            # uncheck and make link, or remove if ignore links is checked
-            pass
-        elif file_obj.get_mark() == FileMarks.DELETE:
-            self.model.removeRow(item.Row())
+        self.beginResetModel()
+        self._group_ids = []
+        self._group_pos = {}
+        self._group_sizes = array("L")
+        self._group_rows = array("q")
+        self._group_rows_valid = 0
+        self._row_count = 0
+        self.endResetModel()
+        
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._row_count
+    
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._headers)
+    
+    def headerData(self, section: int, orientation, role: int = Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self._headers[section]
+        return None
+    
+    def flags(self, index: QModelIndex):
+        if index.column() in self._column_marks:
+            # images that only look the same can't be linked
+            if self._column_marks[index.column()] in LINK_MARK_OPS and self._is_image_row(index.row()):
+                return Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+    
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        group_pos, file_id = self._get_row_file(index.row())
+        if file_id == -1:
+            return None
+        files = self._dup_finder.files
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return files.get_path(file_id)
+            elif column == 1:
+                return str(bytes_to_megabytes(files.sizes[file_id])) + " MB"
+            elif column == 2 and files.links[file_id]:
+                return "LINK"
+        elif role == Qt.CheckStateRole and column in self._column_marks:
+            return Qt.Checked if files.get_mark(file_id) == self._column_marks[column] else Qt.Unchecked
+        elif role == Qt.BackgroundRole and group_pos % 2:
+            # TODO: maybe check for more variety between colors, so we don't get too similar ones?
+            return self.bg_color
+        return None
+    
+    # only one file in a group can be the master, unchecking a file sets it to ignore
+    def setData(self, index: QModelIndex, value, role: int = Qt.EditRole) -> bool:
+        if role != Qt.CheckStateRole or index.column() not in self._column_marks:
+            return False
+        group_pos, file_id = self._get_row_file(index.row())
+        if file_id == -1:
+            return False
+        files = self._dup_finder.files
+        file_mark = self._column_marks[index.column()]
+        if value == Qt.Checked:
+            if file_mark == FileMarks.MASTER:
+                for dup_file_id in self._get_group_files(group_pos):
+                    if dup_file_id != file_id and files.get_mark(dup_file_id) == FileMarks.MASTER:
+                        files.set_mark(dup_file_id, FileMarks.IGNORE)
+            files.set_mark(file_id, file_mark)
+        elif files.get_mark(file_id) == file_mark:
+            files.set_mark(file_id, FileMarks.IGNORE)
+        first_row = self._group_rows[group_pos]
+        self.dataChanged.emit(self.index(first_row, self._check_master),
+                              self.index(first_row + self._group_sizes[group_pos] - 1, self._check_reflink))
+        return True
+    
+    def get_group_file_count(self, group_id: int) -> int:
+        group_pos = self._group_pos.get(group_id)
+        return 0 if group_pos is None else self._group_sizes[group_pos]
+    
+    # new files in groups already shown are inserted after the group's last row,
+    # then all the new groups are added to the end at once
+    def add_batch(self, dup_batch: dict) -> None:
+        new_group_list = []
+        for group_id, dup_file_list in dup_batch.items():
+            group_pos = self._group_pos.get(group_id)
+            if group_pos is None:
+                if dup_file_list:
+                    new_group_list.append((group_id, len(dup_file_list)))
+                continue
+            new_file_count = len(dup_file_list) - self._group_sizes[group_pos]
+            if new_file_count <= 0:
+                continue
+            self._update_group_rows()
+            first_row = self._group_rows[group_pos] + self._group_sizes[group_pos]
+            self.beginInsertRows(QModelIndex(), first_row, first_row + new_file_count - 1)
+            self._group_sizes[group_pos] += new_file_count
+            self._row_count += new_file_count
+            self._group_rows_valid = min(self._group_rows_valid, group_pos + 1)
+            self.endInsertRows()
+        if not new_group_list:
+            return
+        new_row_count = sum(file_count for _, file_count in new_group_list)
+        self.beginInsertRows(QModelIndex(), self._row_count, self._row_count + new_row_count - 1)
+        for group_id, file_count in new_group_list:
+            if self._group_rows_valid == len(self._group_ids):
+                self._group_rows_valid += 1
+            self._group_pos[group_id] = len(self._group_ids)
+            self._group_ids.append(group_id)
+            self._group_sizes.append(file_count)
+            self._group_rows.append(self._row_count)
+            self._row_count += file_count
+        self.endInsertRows()
 
-    def remove_item(self, file_path: str) -> None:
-        pass
-    
-    def add_item(self, file_path: str, check_state: Enum = FileMarks.IGNORE, bg_color: QColor = None) -> None:
-        # self._add_item_row(self.row, file_path, check_state, bg_color)
-        self._add_item_row(self.model.rowCount(), file_path, check_state, bg_color)
-    
-    def insert_item(self, row_index: int, file_path: str, check_state: Enum = FileMarks.IGNORE) -> None:
-        item_at_row = self.model.item(row_index)
-        self.model.insertRow(row_index)
-        self._add_item_row(row_index, file_path, check_state, item_at_row.background().color())
-    
-    def _add_item_row(self, row: int, file_path: str, check_state: Enum = FileMarks.IGNORE,
-                      bg_color: QColor = None) -> None:
-        item_file_path = QStandardItem(file_path)
-        # item_date_mod = QStandardItem(get_date_modified_datetime(file_path).strftime("%Y-%m-%d %H:%M:%S"))
-        # item_date_mod = QStandardItem(str(get_date_modified_datetime(file_path)))
-        item_date_mod = QStandardItem(get_file_size_str(file_path))
-        if os.path.islink(file_path):
-            item_is_link = QStandardItem("LINK")
-        else:
-            item_is_link = QStandardItem()
-        
-        check_master = FileCheckBox()
-        check_link = FileCheckBox()
-        check_del = FileCheckBox()
-        
-        item_file_path.setEditable(False)
-        item_date_mod.setEditable(False)
-        item_is_link.setEditable(False)
-        
-        if bg_color and bg_color.name() != "#000000":
-            item_file_path.setBackground(bg_color)
-            item_date_mod.setBackground(bg_color)
-            item_is_link.setBackground(bg_color)
-            check_master.setBackground(bg_color)
-            check_link.setBackground(bg_color)
-            check_del.setBackground(bg_color)
-            
-        self.model.setItem(row, 0, item_file_path)
-        self.model.setItem(row, 1, item_date_mod)
-        self.model.setItem(row, 2, item_is_link)
-        self.model.setItem(row, self._check_master, check_master)
-        self.model.setItem(row, self._check_link, check_link)
-        self.model.setItem(row, self._check_del, check_del)
-        
-        # doing this earlier breaks shit since on_check_change would be called before they are added to the model
-        if check_state == FileMarks.MASTER:
-            check_master.setCheckState(Qt.Checked)
-        elif check_state == FileMarks.LINK:
-            check_link.setCheckState(Qt.Checked)
-        elif check_state == FileMarks.DELETE:
-            check_del.setCheckState(Qt.Checked)
-    
-    @pyqtSlot(QStandardItem)
-    def on_check_change(self, item: FileCheckBox) -> None:
-        # have to check if it's checked so we don't get a recursion error when we uncheck something
-        # if item.isCheckable() and item.checkState() == Qt.Checked:
-        if item.isCheckable():
-            # TODO: this is causing weird issues (should of seen coming)
-            #  really need to just have a fucking horizontal radio button thing for files
-            #  or a combo box
-            # if item.recurse_check:
-            #     item.recurse_check = False
-            #     return
-            
-            model_index = self.model.indexFromItem(item)
-            row, column = model_index.row(), model_index.column()
-            file_path = self.model.item(row, 0).text()
-            file_obj = self.get_file_obj_row(row)
+    # groups can lose files outside of the list, like from the check before apply, so every group is counted again
+    def refresh_groups(self) -> None:
+        dup_groups = self._dup_finder.dup_groups
+        group_ids = [group_id for group_id in self._group_ids if group_id in dup_groups]
+        self.beginResetModel()
+        self._group_ids = []
+        self._group_pos = {}
+        self._group_sizes = array("L")
+        self._group_rows = array("q")
+        self._row_count = 0
+        for group_id in group_ids:
+            file_count = len(dup_groups.get_group(group_id))
+            self._group_pos[group_id] = len(self._group_ids)
+            self._group_ids.append(group_id)
+            self._group_sizes.append(file_count)
+            self._group_rows.append(self._row_count)
+            self._row_count += file_count
+        self._group_rows_valid = len(self._group_ids)
+        self.endResetModel()
 
-            # if item.checkState() == Qt.Unchecked:
-            #     file_obj.set_mark(FileMarks.IGNORE)
-            #     return
-            
-            if column == self._check_master:
-                if self.file_obj_set_ignore(item, file_obj, FileMarks.MASTER):
-                    return
-                dup_list = main_window.dup_finder.get_dup_list(file_path)
-                for dup_file_path in dup_list:
-                    if dup_file_path != file_path:
-                        self.set_check_master(dup_file_path, Qt.Unchecked)
-                if file_obj.get_mark() != FileMarks.MASTER:
-                    self.set_check_link(file_path, Qt.Unchecked)
-                    self.set_check_del(file_path, Qt.Unchecked)
-                    self.set_check_master(file_path, Qt.Checked)
-                    file_obj.set_mark(FileMarks.MASTER)
-                
-            elif column == self._check_link:
-                if self.file_obj_set_ignore(item, file_obj, FileMarks.LINK):
-                    return
-                if file_obj.get_mark() != FileMarks.LINK:
-                    self.set_check_master(file_path, Qt.Unchecked)
-                    self.set_check_del(file_path, Qt.Unchecked)
-                    self.set_check_link(file_path, Qt.Checked)
-                    file_obj.set_mark(FileMarks.LINK)
-                
-            elif column == self._check_del:
-                if self.file_obj_set_ignore(item, file_obj, FileMarks.DELETE):
-                    return
-                if file_obj.get_mark() != FileMarks.DELETE:
-                    self.set_check_master(file_path, Qt.Unchecked)
-                    self.set_check_link(file_path, Qt.Unchecked)
-                    self.set_check_del(file_path, Qt.Checked)
-                    file_obj.set_mark(FileMarks.DELETE)
-            else:
-                file_obj.set_mark(FileMarks.IGNORE)
-    
-    def set_check_master(self, file_path: str, state) -> None:
-        self._set_check(file_path, state, self._check_master, FileMarks.MASTER)
-    
-    def set_check_link(self, file_path: str, state) -> None:
-        self._set_check(file_path, state, self._check_link, FileMarks.LINK)
-    
-    def set_check_del(self, file_path: str, state) -> None:
-        self._set_check(file_path, state, self._check_del, FileMarks.DELETE)
-    
-    def _set_check(self, file_path: str, state, column: int, file_mark: Enum) -> None:
-        file_path_item = self.get_file_item(file_path)
-        if file_path_item:
-            check_item = self.model.item(file_path_item.row(), column)
-            if check_item and state != check_item.checkState():
-                if state == Qt.Unchecked:
-                    set_file_mark(file_path, FileMarks.IGNORE)
-                else:
-                    set_file_mark(file_path, file_mark)
-                check_item.setCheckState(state)
-                
-    def uncheck_row(self, file_path: str, column_to_keep: int) -> None:
-        file_path_item = self.get_file_item(file_path)
-        if file_path_item:
-            row = file_path_item.row()
-            if column_to_keep != self._check_master:
-                self.uncheck_column(row, self._check_master)
-            if column_to_keep != self._check_link:
-                self.uncheck_column(row, self._check_link)
-            if column_to_keep != self._check_del:
-                self.uncheck_column(row, self._check_del)
-    
-    # this was a mistake
-    def uncheck_row_mistake(self, file_path: str) -> None:
-        file_path_item = self.get_file_item(file_path)
-        if file_path_item:
-            row = file_path_item.row()
-            self.uncheck_column(row, self._check_master)
-            self.uncheck_column(row, self._check_link)
-            self.uncheck_column(row, self._check_del)
-    
-    def uncheck_column(self, row: int, column: int) -> None:
-        check_box = self.model.item(row, column)
-        if check_box:
-            self.uncheck_item_old(check_box)
-            
-    @staticmethod
-    def uncheck_item_old(check_box: FileCheckBox) -> None:
-        check_box.recurse_check = True
-        check_box.setCheckState(Qt.Unchecked)
-        
-    @staticmethod
-    def file_obj_set_ignore(item: QStandardItem, file_obj: File, old_file_mark: Enum) -> bool:
-        if item.checkState() == Qt.Unchecked:
-            if file_obj.get_mark() == old_file_mark:
-                file_obj.set_mark(FileMarks.IGNORE)
-            return True
-        return False
-    
-    def _get_iter(self) -> iter:
-        return range(0, self.model.rowCount())
-    
-    def get_file_item(self, file_path: str) -> QStandardItem:
-        for file_index in self._get_iter():
-            item = self.model.item(file_index)
-            if item and item.text() == file_path:
-                return item
+    def apply_callback(self, file_obj: File, dup_list: list) -> None:
+        row = self.get_file_row(file_obj.path)
+        if row != -1:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self._headers) - 1))
+    
+    def _update_group_rows(self) -> None:
+        for group_pos in range(max(self._group_rows_valid, 1), len(self._group_ids)):
+            self._group_rows[group_pos] = self._group_rows[group_pos - 1] + self._group_sizes[group_pos - 1]
+        self._group_rows_valid = len(self._group_ids)
+    
+    def _get_group_files(self, group_pos: int) -> list:
+        group = self._dup_finder.dup_groups.get_group(self._group_ids[group_pos])
+        return group[:self._group_sizes[group_pos]]
+    
+    # returns (group index, file id), the file id is -1 if there is no file at the row
+    def _get_row_file(self, row: int) -> tuple:
+        if row < 0 or row >= self._row_count:
+            return -1, -1
+        self._update_group_rows()
+        group_pos = bisect_right(self._group_rows, row) - 1
+        group = self._dup_finder.dup_groups.get_group(self._group_ids[group_pos])
+        file_index = row - self._group_rows[group_pos]
+        if file_index >= len(group):
+            return group_pos, -1
+        return group_pos, group[file_index]
     
+    def _is_image_row(self, row: int) -> bool:
+        group_pos = self._get_row_file(row)[0]
+        return group_pos != -1 and self._dup_finder.is_image_group(self._group_ids[group_pos])
+
+    # returns -1 if the file isn't shown
     def get_file_row(self, file_path: str) -> int:
-        return self.get_file_item(file_path).row()
+        file_id = self._dup_finder.files.get_id(file_path)
+        group_id = self._dup_finder.dup_groups.get_group_id(file_id)
+        group_pos = self._group_pos.get(group_id)
+        if file_id == -1 or group_pos is None:
+            return -1
+        file_index = self._dup_finder.dup_groups.get_group(group_id).index(file_id)
+        if file_index >= self._group_sizes[group_pos]:
+            return -1
+        self._update_group_rows()
+        return self._group_rows[group_pos] + file_index
     
     def get_file_obj_row(self, row_selected: int) -> File:
-        return get_file_obj(self.model.item(row_selected, 0).text())
+        file_id = self._get_row_file(row_selected)[1]
+        if file_id != -1:
+            return self._dup_finder.files.get_file(file_id)
     
     
 def get_file_obj(file_path: str) -> File:
@@ -604,18 +620,6 @@ def set_file_mark(file_path: str, file_mark: Enum) -> None:
     get_file_obj(file_path).set_mark(file_mark)
 
 
-def get_file_size(file_path: str) -> int:
-    if not os.path.islink(file_path):
-        return os.path.getsize(file_path)
-
-
-def get_file_size_str(file_path: str) -> str:
-    try:
-        return str(bytes_to_megabytes(os.path.getsize(file_path))) + " MB"
-    except FileNotFoundError:
-        return "0 MB"
-
-
 def bytes_to_megabytes(bytes_: int) -> float:
     if os.name == "nt":
         return round(bytes_ * 0.00000095367432, 3)  # use 1024 multiples for windows
@@ -0,0 +1,84 @@
+import os
+import argparse
+import tempfile
+from time import perf_counter
+import dup_finder
+from dup_finder import HASH_ALGORITHMS, BLOCKSIZE
+
+# compares hashing a file with the old read loop, reading into a reused buffer, and mmap
+# without --files, a temp file of random bytes is made, so it's mostly in the os cache and this shows the cpu side
+# nothing here drops the files from the os cache between runs, use files bigger than ram to see disk speed
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--files", '-f', default=[], nargs="+", help="files to hash instead of a temp file")
+    arg_parser.add_argument("--size", '-s', default=256, type=int, help="size of the temp file in MiB")
+    arg_parser.add_argument("--hash_algorithm", default=[], nargs="+", choices=sorted(HASH_ALGORITHMS),
+                            help="algorithms to test, all of them by default")
+    arg_parser.add_argument("--read_blocksize", default=[65536, BLOCKSIZE], type=int, nargs="+",
+                            help="block sizes to test")
+    arg_parser.add_argument("--runs", '-r', default=3, type=int, help="best of this many runs is used")
+    return arg_parser.parse_args()
+
+
+# how dup_finder hashed files before, a new bytes object for every block
+def hash_read_loop(file_path: str, hash_algorithm: str, blocksize: int) -> int:
+    with open(file_path, "rb") as file_io:
+        file_hash = HASH_ALGORITHMS[hash_algorithm]()
+        bytes_read = 0
+        file_buffer = file_io.read(blocksize)
+        while file_buffer:
+            file_hash.update(file_buffer)
+            bytes_read += len(file_buffer)
+            file_buffer = file_io.read(blocksize)
+    return bytes_read
+
+
+def hash_buffer(file_path: str, hash_algorithm: str, blocksize: int) -> int:
+    with open(file_path, "rb", buffering=0) as file_io:
+        return dup_finder._update_hash_read(HASH_ALGORITHMS[hash_algorithm](), file_io, blocksize)
+
+
+def hash_mmap(file_path: str, hash_algorithm: str, blocksize: int) -> int:
+    with open(file_path, "rb", buffering=0) as file_io:
+        return dup_finder._update_hash_mmap(HASH_ALGORITHMS[hash_algorithm](), file_io, blocksize)
+
+
+HASH_METHODS = {"read": hash_read_loop, "buffer": hash_buffer, "mmap": hash_mmap}
+
+
+def run_benchmark(file_list: list, hash_algorithm_list: list, blocksize_list: list, runs: int) -> None:
+    print("algorithm  blocksize  method   MiB/s")
+    for hash_algorithm in hash_algorithm_list:
+        for blocksize in blocksize_list:
+            for method_name, hash_method in HASH_METHODS.items():
+                best_time = None
+                bytes_read = 0
+                for _ in range(max(runs, 1)):
+                    start = perf_counter()
+                    bytes_read = sum(hash_method(file_path, hash_algorithm, blocksize) for file_path in file_list)
+                    run_time = perf_counter() - start
+                    best_time = run_time if best_time is None else min(best_time, run_time)
+                print("%-10s %-10d %-8s %.1f" % (hash_algorithm, blocksize, method_name,
+                                                 bytes_read / 1048576 / max(best_time, 1e-9)))
+
+
+def main() -> None:
+    args = parse_args()
+    hash_algorithm_list = args.hash_algorithm or sorted(HASH_ALGORITHMS)
+    if args.files:
+        run_benchmark(args.files, hash_algorithm_list, args.read_blocksize, args.runs)
+        return
+    temp_fd, temp_path = tempfile.mkstemp()
+    try:
+        with os.fdopen(temp_fd, "wb") as temp_io:
+            for _ in range(args.size):
+                temp_io.write(os.urandom(1048576))
+        run_benchmark([temp_path], hash_algorithm_list, args.read_blocksize, args.runs)
+    finally:
+        os.remove(temp_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import time
+import sqlite3
+from threading import Lock
+
+
+# how many new hashes to hold before writing them to the database
+COMMIT_INTERVAL = 1000
+SECONDS_PER_DAY = 86400
+
+
+# a file is only considered the same as the cached one if the device, inode, size and date modified all match,
+# otherwise it's a miss and the entry gets replaced when the file is hashed again
+# hashes are stored with the name of the hash algorithm in front, ones from another algorithm are a miss too
+class HashCache:
+    def __init__(self, cache_path: str, hash_algorithm: str = ""):
+        self.cache_path = cache_path
+        self.hash_prefix = hash_algorithm + ":" if hash_algorithm else ""
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._pending = {}  # key is (device, inode), value is the row to write
+        self._seen = set()  # (device, inode) of entries that were hit, to update last_seen on close
+        self._lock = Lock()
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS file_hashes ("
+                         "device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, "
+                         "partial_hash TEXT, full_hash TEXT, last_seen INTEGER, "
+                         "PRIMARY KEY (device, inode))")
+        # anything else to keep between scans, like the file count of the last search
+        self._db.execute("CREATE TABLE IF NOT EXISTS scan_info (name TEXT PRIMARY KEY, value INTEGER)")
+        self._db.commit()
+
+    def get(self, file_key: tuple) -> tuple:
+        device, inode, file_size, mtime_ns = file_key
+        with self._lock:
+            row = self._pending.get((device, inode))
+            if row is None:
+                row = self._db.execute("SELECT size, mtime_ns, partial_hash, full_hash FROM file_hashes "
+                                       "WHERE device = ? AND inode = ?", (device, inode)).fetchone()
+            else:
+                row = row[2:6]
+            if row is None or row[0] != file_size or row[1] != mtime_ns:
+                return "", ""
+            self._seen.add((device, inode))
+            return self._remove_prefix(row[2]), self._remove_prefix(row[3])
+
+    def set(self, file_key: tuple, partial_hash: str = "", full_hash: str = "") -> None:
+        device, inode, file_size, mtime_ns = file_key
+        if not inode:
+            return
+        old_partial_hash, old_full_hash = self.get(file_key)
+        with self._lock:
+            self._pending[(device, inode)] = (device, inode, file_size, mtime_ns,
+                                              self._add_prefix(partial_hash or old_partial_hash),
+                                              self._add_prefix(full_hash or old_full_hash),
+                                              int(time.time()))
+            if len(self._pending) >= COMMIT_INTERVAL:
+                self._commit()
+
+    def _add_prefix(self, file_hash: str) -> str:
+        return self.hash_prefix + file_hash if file_hash else ""
+
+    def _remove_prefix(self, file_hash: str) -> str:
+        if file_hash and file_hash.startswith(self.hash_prefix):
+            return file_hash[len(self.hash_prefix):]
+        return ""
+
+    def get_info(self, name: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM scan_info WHERE name = ?", (name, )).fetchone()
+            return row[0] if row else 0
+
+    def set_info(self, name: str, value: int) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO scan_info VALUES (?, ?)", (name, value))
+            self._db.commit()
+
+    def add_hit(self, bytes_saved: int) -> None:
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += bytes_saved
+
+    def add_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def get_stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "bytes_saved": self.bytes_saved}
+
+    def evict(self, max_age_days: float) -> int:
+        with self._lock:
+            self._commit()
+            cutoff = int(time.time() - max_age_days * SECONDS_PER_DAY)
+            cursor = self._db.execute("DELETE FROM file_hashes WHERE last_seen < ?", (cutoff, ))
+            self._db.commit()
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+    # needs self._lock held
+    def _commit(self) -> None:
+        self._db.executemany("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             self._pending.values())
+        self._pending = {}
+        now = int(time.time())
+        self._db.executemany("UPDATE file_hashes SET last_seen = ? WHERE device = ? AND inode = ?",
+                             ((now, device, inode) for device, inode in self._seen))
+        self._seen = set()
+        self._db.commit()
+
+
+def get_file_key(file_path: str, file_stat: os.stat_result = None) -> tuple:
+    if file_stat is None:
+        file_stat = os.stat(file_path)
+    return file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns
@@ -0,0 +1,135 @@
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# finds images that look the same, like one photo saved again at another quality or size, which never hash the same
+# each image is shrunk to a few gray pixels and turned into a 64 bit perceptual hash, a batch of images at a time
+# images are the same if their hashes are only a few bits apart, those are found with a bk-tree
+# instead of checking every pair
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+IMAGE_BATCH_SIZE = 64  # images hashed together in 1 process
+# key is the hash name, value is the (width, height) images are shrunk to for it
+IMAGE_HASH_SIZES = {
+    "ahash": (8, 8),  # each pixel brighter than the average
+    "dhash": (9, 8),  # each pixel brighter than the one to the left of it
+    "phash": (32, 32),  # each of the lowest frequencies of a dct higher than their median, the best at re-encoded images
+}
+DEFAULT_IMAGE_HASH = "phash"
+DEFAULT_IMAGE_DISTANCE = 8  # bits out of 64
+
+
+def can_hash_images() -> bool:
+    return numpy is not None and Image is not None
+
+
+# image_exts are lowercase, with the dot
+def is_image_path(file_path: str, image_exts: tuple = IMAGE_EXTS) -> bool:
+    return os.path.splitext(file_path)[1].lower() in image_exts
+
+
+def hamming_distance(image_hash: int, other_image_hash: int) -> int:
+    return bin(image_hash ^ other_image_hash).count("1")
+
+
+# returns None if it isn't an image pillow can open
+def load_image(file_path: str, size: tuple):
+    try:
+        with Image.open(file_path) as image:
+            # only does anything for jpegs, which can be decoded at a fraction of their size
+            image.draft("L", (size[0] * 4, size[1] * 4))
+            return numpy.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=numpy.float32)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def get_dct_matrix(size: int, rows: int):
+    frequencies = numpy.arange(rows, dtype=numpy.float32).reshape(rows, 1)
+    positions = numpy.arange(size, dtype=numpy.float32).reshape(1, size)
+    return numpy.cos(numpy.pi * (2 * positions + 1) * frequencies / (2 * size))
+
+
+# pixels is (images, height, width), returns (images, 64) of bools
+def get_hash_bits(pixels, hash_name: str):
+    image_count = pixels.shape[0]
+    if hash_name == "ahash":
+        return (pixels > pixels.mean(axis=(1, 2), keepdims=True)).reshape(image_count, 64)
+    if hash_name == "dhash":
+        return (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(image_count, 64)
+    # only the 8 lowest frequencies in each direction are needed, so only those rows of the dct are used
+    dct_matrix = get_dct_matrix(pixels.shape[1], 8)
+    frequencies = numpy.matmul(numpy.matmul(dct_matrix, pixels), dct_matrix.T).reshape(image_count, 64)
+    # the first one is the average brightness, it would throw off the median
+    medians = numpy.median(frequencies[:, 1:], axis=1, keepdims=True)
+    return frequencies > medians
+
+
+# returns a hash for each path, -1 for ones that couldn't be opened
+# this runs in the hash processes, so it has to be a module function
+def hash_images(file_path_list: list, hash_name: str = DEFAULT_IMAGE_HASH) -> list:
+    size = IMAGE_HASH_SIZES[hash_name]
+    image_hashes = [-1] * len(file_path_list)
+    loaded_index_list, pixel_list = [], []
+    for index, file_path in enumerate(file_path_list):
+        pixels = load_image(file_path, size)
+        if pixels is not None:
+            loaded_index_list.append(index)
+            pixel_list.append(pixels)
+    if not pixel_list:
+        return image_hashes
+    hash_bits = get_hash_bits(numpy.stack(pixel_list), hash_name)
+    packed_hashes = numpy.packbits(hash_bits, axis=1).view(">u8").ravel()
+    for index, image_hash in zip(loaded_index_list, packed_hashes):
+        image_hashes[index] = int(image_hash)
+    return image_hashes
+
+
+# each node is [hash, items, children], children is a dict of distance to node
+# every hash in a child is that distance from its parent, so a search only visits children
+# within the max distance of the distance to the parent
+class BKTree:
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def add(self, image_hash: int, item) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [image_hash, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(image_hash, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [image_hash, [item], {}]
+                return
+            node = child
+
+    # returns [(distance, item)]
+    def search(self, image_hash: int, max_distance: int) -> list:
+        found = []
+        nodes = [self._root] if self._root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = hamming_distance(image_hash, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return found
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,129 @@
+import hashlib
+from random import Random
+from threading import Lock
+
+# finds files that share most of their bytes without being the same, like vm images or archives with other headers
+# files are cut into chunks where the content says to (fastcdc, with a gear rolling hash), not at fixed offsets,
+# so bytes added or removed near the start of a file only change the chunks around them
+# a file is read a block at a time, only the block and the chunk being cut are held in memory,
+# and only a short hash and the size of each chunk is kept
+
+CHUNK_AVG_SIZE = 65536
+CHUNK_DIGEST_SIZE = 8  # bytes of blake2b kept for each chunk, a collision only counts a chunk as shared by mistake
+MAX_CHUNK_FILES = 64  # chunks found in more files than this, like blocks of zeros, say nothing about similarity
+GEAR_WINDOW = 64  # bytes before the cut point that the gear hash depends on, one for each bit
+MASK_64 = (1 << 64) - 1
+# fixed seed, so chunk hashes from different runs or processes can be compared
+_gear_random = Random(0x6765617220636463)
+GEAR_TABLE = tuple(_gear_random.getrandbits(64) for _ in range(256))
+
+
+def get_chunk_sizes(avg_size: int) -> tuple:
+    return max(avg_size // 4, GEAR_WINDOW), avg_size, avg_size * 8
+
+
+# the top bits of the gear hash depend on the most bytes, so the masks use those
+# normalized chunking: a harder mask before the average size and an easier one after, so sizes stay close to it
+def get_chunk_masks(avg_size: int) -> tuple:
+    bits = max(avg_size.bit_length() - 1, 2)
+    return ((1 << (bits + 1)) - 1) << (64 - bits - 1), ((1 << (bits - 1)) - 1) << (64 - bits + 1)
+
+
+# returns where the first chunk of data ends
+def find_chunk_end(data: bytes, min_size: int, avg_size: int, max_size: int, masks: tuple) -> int:
+    data_size = len(data)
+    if data_size <= min_size:
+        return data_size
+    end = min(data_size, max_size)
+    normal_end = min(end, avg_size)
+    gear_table = GEAR_TABLE
+    small_mask, large_mask = masks
+    gear_hash = 0
+    # nothing before the minimum size can be a cut point, the hash only needs the bytes just before it
+    for byte in data[max(min_size - GEAR_WINDOW, 0):min_size]:
+        gear_hash = ((gear_hash << 1) + gear_table[byte]) & MASK_64
+    position = min_size
+    for byte in data[min_size:normal_end]:
+        gear_hash = ((gear_hash << 1) + gear_table[byte]) & MASK_64
+        position += 1
+        if not gear_hash & small_mask:
+            return position
+    for byte in data[normal_end:end]:
+        gear_hash = ((gear_hash << 1) + gear_table[byte]) & MASK_64
+        position += 1
+        if not gear_hash & large_mask:
+            return position
+    return end
+
+
+# yields (chunk hash, chunk size) for each chunk of the file
+def iter_file_chunks(file_io, avg_size: int = CHUNK_AVG_SIZE, blocksize: int = 1048576):
+    min_size, avg_size, max_size = get_chunk_sizes(avg_size)
+    masks = get_chunk_masks(avg_size)
+    pending = bytearray()
+    end_of_file = False
+    while pending or not end_of_file:
+        while not end_of_file and len(pending) < max_size:
+            file_buffer = file_io.read(blocksize)
+            if not file_buffer:
+                end_of_file = True
+            pending += file_buffer
+        if not pending:
+            break
+        chunk_end = find_chunk_end(bytes(pending[:max_size]), min_size, avg_size, max_size, masks)
+        yield hashlib.blake2b(pending[:chunk_end], digest_size=CHUNK_DIGEST_SIZE).digest(), chunk_end
+        del pending[:chunk_end]
+
+
+# returns (dict of chunk hash to chunk size, bytes read), a chunk found more than once in the file is counted once
+# an empty dict if the file can't be read, this runs in the hash processes, so it has to be a module function
+def chunk_file(file_path: str, avg_size: int = CHUNK_AVG_SIZE, blocksize: int = 1048576) -> tuple:
+    file_chunks = {}
+    bytes_read = 0
+    try:
+        with open(file_path, "rb") as file_io:
+            for chunk_hash, chunk_size in iter_file_chunks(file_io, avg_size, blocksize):
+                file_chunks[chunk_hash] = chunk_size
+                bytes_read += chunk_size
+    except OSError:
+        return {}, bytes_read
+    return file_chunks, bytes_read
+
+
+# key is chunk hash, value is the files it was found in
+# the bytes 2 files share are counted as each file is added, so only pairs that share something are kept
+class ChunkIndex:
+    def __init__(self, max_chunk_files: int = MAX_CHUNK_FILES):
+        self.max_chunk_files = max_chunk_files
+        self._chunk_files = {}
+        self._shared_bytes = {}  # key is (file id, file id), lowest first
+        self._lock = Lock()
+
+    def add(self, file_id: int, file_chunks: dict) -> None:
+        with self._lock:
+            for chunk_hash, chunk_size in file_chunks.items():
+                chunk_file_ids = self._chunk_files.get(chunk_hash)
+                if chunk_file_ids is None:
+                    self._chunk_files[chunk_hash] = [file_id]
+                    continue
+                if len(chunk_file_ids) >= self.max_chunk_files:
+                    continue
+                for other_file_id in chunk_file_ids:
+                    pair = (other_file_id, file_id) if other_file_id < file_id else (file_id, other_file_id)
+                    self._shared_bytes[pair] = self._shared_bytes.get(pair, 0) + chunk_size
+                chunk_file_ids.append(file_id)
+
+    # returns [(file id, file id, shared bytes, similarity)], most similar first
+    # similarity is the percent of the bigger file that's in the other one too
+    def get_similar_pairs(self, file_sizes, min_similarity: float) -> list:
+        similar_pairs = []
+        with self._lock:
+            for (file_id, other_file_id), shared_bytes in self._shared_bytes.items():
+                similarity = shared_bytes * 100.0 / max(file_sizes[file_id], file_sizes[other_file_id], 1)
+                if similarity >= min_similarity:
+                    similar_pairs.append((file_id, other_file_id, shared_bytes, similarity))
+        similar_pairs.sort(key=lambda similar_pair: -similar_pair[3])
+        return similar_pairs
+
+    def __len__(self) -> int:
+        return len(self._chunk_files)
@@ -0,0 +1,256 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from dup_finder import DuplicateFinder, FileMarks, IMAGE_GROUP
+from apply_engine import ApplyEngine, ApplyJournal, make_apply_op, get_temp_path
+
+# apply, resume and rollback on files in a temp directory
+# run with: python -m unittest test_apply_engine
+
+
+class ApplyTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.directory, "journal.jsonl")
+        self.search_directory = os.path.join(self.directory, "files")
+        os.mkdir(self.search_directory)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def get_path(self, name: str) -> str:
+        return os.path.join(self.search_directory, name)
+
+    def write_file(self, name: str, content: bytes, mtime_ns: int = None) -> str:
+        file_path = self.get_path(name)
+        with open(file_path, "wb") as file_io:
+            file_io.write(content)
+        if mtime_ns is not None:
+            os.utime(file_path, ns=(mtime_ns, mtime_ns))
+        return file_path
+
+    def read_file(self, name: str) -> bytes:
+        with open(self.get_path(name), "rb") as file_io:
+            return file_io.read()
+
+    # marks is a dict of file name to mark
+    def search(self, marks: dict) -> DuplicateFinder:
+        dup_finder = DuplicateFinder()
+        dup_finder.add_search_dir(self.search_directory)
+        dup_finder.apply_journal_path = self.journal_path
+        dup_finder.start_search()
+        for name, file_mark in marks.items():
+            dup_finder.files.set_mark(dup_finder.files.get_id(self.get_path(name)), file_mark)
+        return dup_finder
+
+    def load_journal(self) -> ApplyJournal:
+        journal = ApplyJournal(self.journal_path)
+        journal.load()
+        return journal
+
+    # removes the last done lines, like a crash right after their ops finished
+    def cut_journal(self, done_count: int) -> None:
+        with open(self.journal_path, "r", encoding="utf-8") as journal_io:
+            lines = journal_io.readlines()
+        kept_lines, removed = [], 0
+        for line in reversed(lines):
+            if removed < done_count and "done" in json.loads(line):
+                removed += 1
+                continue
+            kept_lines.insert(0, line)
+        with open(self.journal_path, "w", encoding="utf-8") as journal_io:
+            journal_io.writelines(kept_lines)
+
+
+class TestApply(ApplyTestCase):
+    def test_apply_every_mark(self):
+        content = os.urandom(50000)
+        for name in ("master", "link", "hardlink", "reflink", "delete", "ignore"):
+            self.write_file(name, content)
+        dup_finder = self.search({"master": FileMarks.MASTER, "link": FileMarks.LINK,
+                                  "hardlink": FileMarks.HARDLINK, "reflink": FileMarks.REFLINK,
+                                  "delete": FileMarks.DELETE, "ignore": FileMarks.IGNORE})
+        dup_finder.use_oldest_mod_date = False
+        self.assertTrue(dup_finder.apply())
+
+        self.assertEqual(os.readlink(self.get_path("link")), self.get_path("master"))
+        self.assertTrue(os.path.samefile(self.get_path("hardlink"), self.get_path("master")))
+        self.assertFalse(os.path.islink(self.get_path("hardlink")))
+        # a reflink can fall back to a hardlink or a system link, it has the same bytes either way
+        self.assertEqual(self.read_file("reflink"), content)
+        self.assertFalse(os.path.lexists(self.get_path("delete")))
+        self.assertFalse(os.path.islink(self.get_path("ignore")))
+        self.assertEqual(self.read_file("ignore"), content)
+        self.assertEqual(self.read_file("master"), content)
+        self.assertFalse(any(name.endswith(".dup_finder_tmp") for name in os.listdir(self.search_directory)))
+
+        journal = self.load_journal()
+        self.assertEqual(len(journal.ops), 4)
+        self.assertEqual(journal.done, {apply_op["id"] for apply_op in journal.ops})
+        self.assertFalse(journal.failed)
+
+    def test_apply_skips_file_changed_after_search(self):
+        content = os.urandom(20000)
+        self.write_file("master", content)
+        self.write_file("delete", content)
+        dup_finder = self.search({"master": FileMarks.MASTER, "delete": FileMarks.DELETE})
+        apply_ops = dup_finder.get_apply_ops()
+        self.write_file("delete", os.urandom(20000))
+        apply_engine = ApplyEngine(self.journal_path)
+        self.assertTrue(apply_engine.run(apply_ops))
+        self.assertTrue(os.path.isfile(self.get_path("delete")))
+        self.assertEqual(apply_engine.ops_failed, 1)
+
+    def test_space_saved_skips_file_with_other_hardlinks(self):
+        content = os.urandom(20000)
+        self.write_file("m1", content)
+        self.write_file("m2", content)
+        self.write_file("m3", content)
+        os.link(self.get_path("m1"), self.get_path("m1_hl"))
+        dup_finder = self.search({"m2": FileMarks.MASTER})
+        file_id = dup_finder.files.get_id(self.get_path("m1"))
+        if dup_finder.dup_groups.get_group_id(file_id) == -1:
+            file_id = dup_finder.files.get_id(self.get_path("m1_hl"))
+        dup_finder.files.set_mark(file_id, FileMarks.HARDLINK)
+        self.assertEqual(dup_finder.space_saved, 0)
+        dup_finder.files.set_mark(dup_finder.files.get_id(self.get_path("m3")), FileMarks.DELETE)
+        self.assertEqual(dup_finder.space_saved, 20000)
+        dup_finder.files.set_mark(file_id, FileMarks.IGNORE)
+        self.assertEqual(dup_finder.space_saved, 20000)
+
+
+class TestRollback(ApplyTestCase):
+    def test_rollback_after_partial_journal(self):
+        content = os.urandom(50000)
+        old_mtime_ns = 1500000000 * 10 ** 9
+        self.write_file("master", content)
+        self.write_file("link", content, old_mtime_ns)
+        self.write_file("hardlink", content)
+        self.write_file("delete", content)
+        mtimes = {name: os.stat(self.get_path(name)).st_mtime_ns for name in ("master", "link", "hardlink", "delete")}
+        dup_finder = self.search({"master": FileMarks.MASTER, "link": FileMarks.LINK,
+                                  "hardlink": FileMarks.HARDLINK, "delete": FileMarks.DELETE})
+        self.assertTrue(dup_finder.apply())
+        self.assertEqual(os.stat(self.get_path("master")).st_mtime_ns, old_mtime_ns)
+        # the last 2 ops finished, but the apply stopped before they were written as done
+        self.cut_journal(2)
+        self.assertEqual(len(self.load_journal().get_unfinished()), 2)
+
+        apply_engine = ApplyEngine(self.journal_path)
+        self.assertTrue(apply_engine.rollback())
+        self.assertEqual(apply_engine.ops_failed, 0)
+        for name, mtime_ns in mtimes.items():
+            file_path = self.get_path(name)
+            self.assertFalse(os.path.islink(file_path), name)
+            self.assertEqual(self.read_file(name), content, name)
+            self.assertEqual(os.stat(file_path).st_mtime_ns, mtime_ns, name)
+        self.assertFalse(os.path.samefile(self.get_path("hardlink"), self.get_path("master")))
+        self.assertFalse(self.load_journal().get_unfinished())
+
+    def test_new_apply_refused_while_journal_unfinished(self):
+        content = os.urandom(20000)
+        self.write_file("master", content)
+        self.write_file("link", content)
+        dup_finder = self.search({"master": FileMarks.MASTER, "link": FileMarks.LINK})
+        dup_finder.use_oldest_mod_date = False
+        self.assertTrue(dup_finder.apply())
+        self.cut_journal(1)
+        self.assertFalse(ApplyEngine(self.journal_path).run([]))
+
+
+class TestResume(ApplyTestCase):
+    def make_journal(self, apply_ops: list) -> None:
+        journal = ApplyJournal(self.journal_path)
+        journal.start(apply_ops)
+        journal.close()
+
+    def make_op(self, op_name: str, name: str, source_name: str = "") -> dict:
+        file_stat = os.stat(self.get_path(name))
+        return make_apply_op(op_name, 0, self.get_path(name), file_stat.st_size, file_stat.st_mtime_ns,
+                             self.get_path(source_name) if source_name else "")
+
+    def test_resume_op_cut_off_after_replace(self):
+        content = os.urandom(30000)
+        self.write_file("master", content)
+        self.write_file("link", content)
+        self.write_file("hardlink", content)
+        self.make_journal([self.make_op("link", "link", "master"), self.make_op("hardlink", "hardlink", "master")])
+        # both ops got as far as renaming the new link over the file, but weren't written as done
+        os.symlink(self.get_path("master"), get_temp_path(self.get_path("link")))
+        os.replace(get_temp_path(self.get_path("link")), self.get_path("link"))
+        os.link(self.get_path("master"), get_temp_path(self.get_path("hardlink")))
+        os.replace(get_temp_path(self.get_path("hardlink")), self.get_path("hardlink"))
+
+        apply_engine = ApplyEngine(self.journal_path)
+        self.assertTrue(apply_engine.resume())
+        self.assertEqual((apply_engine.ops_done, apply_engine.ops_failed), (2, 0))
+        self.assertEqual(os.readlink(self.get_path("link")), self.get_path("master"))
+        self.assertTrue(os.path.samefile(self.get_path("hardlink"), self.get_path("master")))
+        self.assertFalse(self.load_journal().get_unfinished())
+
+    def test_resume_op_cut_off_before_replace(self):
+        content = os.urandom(30000)
+        self.write_file("master", content)
+        self.write_file("link", content)
+        self.make_journal([self.make_op("link", "link", "master")])
+        # the temp link was made, but not renamed over the file yet
+        os.symlink(self.get_path("master"), get_temp_path(self.get_path("link")))
+
+        apply_engine = ApplyEngine(self.journal_path)
+        self.assertTrue(apply_engine.resume())
+        self.assertEqual((apply_engine.ops_done, apply_engine.ops_failed), (1, 0))
+        self.assertEqual(os.readlink(self.get_path("link")), self.get_path("master"))
+        self.assertFalse(os.path.lexists(get_temp_path(self.get_path("link"))))
+
+
+class TestVerify(ApplyTestCase):
+    def test_verify_drops_group_with_changed_master(self):
+        content = os.urandom(40000)
+        for name in ("a", "b", "c"):
+            self.write_file(name, content)
+        dup_finder = self.search({"a": FileMarks.MASTER, "b": FileMarks.DELETE, "c": FileMarks.DELETE})
+        self.write_file("a", os.urandom(100))
+        self.assertTrue(dup_finder.apply())
+        self.assertEqual(len(dup_finder.dup_groups), 0)
+        for name in ("b", "c"):
+            self.assertEqual(self.read_file(name), content)
+
+    def test_verify_keeps_file_with_only_new_date(self):
+        content = os.urandom(40000)
+        for name in ("a", "b", "c"):
+            self.write_file(name, content)
+        dup_finder = self.search({"a": FileMarks.MASTER, "b": FileMarks.DELETE, "c": FileMarks.IGNORE})
+        os.utime(self.get_path("b"), ns=(10 ** 18, 10 ** 18))
+        self.write_file("c", os.urandom(40000), os.stat(self.get_path("c")).st_mtime_ns + 1)
+        verify_counts = dup_finder.verify_groups()
+        self.assertEqual((verify_counts["changed"], verify_counts["removed"]), (2, 1))
+        self.assertEqual(sorted(dup_finder.dup_groups.get_path_lists()[0]), [self.get_path("a"), self.get_path("b")])
+
+    def test_no_deletes_without_a_kept_file(self):
+        content = os.urandom(40000)
+        for name in ("a", "b"):
+            self.write_file(name, content)
+        dup_finder = self.search({"a": FileMarks.DELETE, "b": FileMarks.DELETE})
+        self.assertEqual(dup_finder.get_apply_ops(), [])
+
+    def test_no_image_deletes_without_a_kept_file(self):
+        for name in ("a.jpg", "b.jpg", "c.jpg"):
+            self.write_file(name, os.urandom(1000))
+        dup_finder = self.search({})
+        file_ids = [dup_finder.files.get_id(self.get_path(name)) for name in ("a.jpg", "b.jpg", "c.jpg")]
+        dup_finder.dup_groups.add((IMAGE_GROUP, "0" * 16, file_ids[0]), file_ids)
+        for file_id in file_ids:
+            dup_finder.files.set_mark(file_id, FileMarks.DELETE)
+        self.assertEqual(dup_finder.get_apply_ops(), [])
+        # images can't be linked, so one marked to be is ignored and kept, and the others can go
+        dup_finder.files.set_mark(file_ids[2], FileMarks.LINK)
+        self.assertEqual(dup_finder.files.get_mark(file_ids[2]), FileMarks.IGNORE)
+        self.assertEqual(dup_finder.space_saved, 2000)
+        delete_paths = [apply_op["path"] for apply_op in dup_finder.get_apply_ops() if apply_op["op"] == "delete"]
+        self.assertEqual(sorted(delete_paths), [self.get_path("a.jpg"), self.get_path("b.jpg")])
+
+
+if __name__ == "__main__":
+    unittest.main()
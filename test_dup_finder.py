@@ -0,0 +1,179 @@
+import os
+import json
+import errno
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import queue
+import dup_finder
+from dup_finder import DuplicateFinder, DeviceQueue, compare_file_list
+from image_hash import is_image_path
+
+# searches on files in a temp directory
+# run with: python -m unittest test_dup_finder
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def get_path(self, *names: str) -> str:
+        return os.path.join(self.directory, *names)
+
+    def write_file(self, content: bytes, *names: str) -> str:
+        file_path = self.get_path(*names)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as file_io:
+            file_io.write(content)
+        return file_path
+
+    def search(self, snapshot_path: str = "") -> DuplicateFinder:
+        dup_finder = DuplicateFinder()
+        dup_finder.add_search_dir(self.directory)
+        dup_finder.snapshot_path = snapshot_path
+        dup_finder.incremental = bool(snapshot_path)
+        dup_finder.start_search()
+        return dup_finder
+
+
+class TestSearch(SearchTestCase):
+    def test_unreadable_directory_doesnt_stop_search(self):
+        for sub_directory in ("a", "bad", "c"):
+            self.write_file(b"same", sub_directory, "x")
+            self.write_file(b"same", sub_directory, "y")
+        scandir = os.scandir
+
+        def scandir_eio(directory):
+            if str(directory).endswith("bad"):
+                raise OSError(errno.EIO, "Input/output error")
+            return scandir(directory)
+
+        with mock.patch.object(dup_finder.os, "scandir", scandir_eio):
+            dup_finder_obj = self.search()
+        self.assertEqual(len(dup_finder_obj.files), 4)
+        self.assertEqual(len(dup_finder_obj.dup_groups), 1)
+
+    def test_progress_callbacks_are_throttled(self):
+        for index in range(300):
+            self.write_file(str(index % 100).encode(), "d" + str(index % 10), str(index))
+        calls = {"scanned": [], "total": [], "hash": []}
+        dup_finder_obj = DuplicateFinder()
+        dup_finder_obj.add_search_dir(self.directory)
+        dup_finder_obj.progress_interval = 60
+        dup_finder_obj.set_file_scanned_callback(calls["scanned"].append)
+        dup_finder_obj.set_total_files_callback(calls["total"].append)
+        dup_finder_obj.set_hash_progress_callback(lambda bytes_hashed, bytes_to_hash:
+                                                  calls["hash"].append((bytes_hashed, bytes_to_hash)))
+        dup_finder_obj.start_search()
+        self.assertLessEqual(len(calls["scanned"]), 2)
+        self.assertLessEqual(len(calls["total"]), 3)
+        self.assertLessEqual(len(calls["hash"]), 2)
+        # the last call always has the final numbers
+        self.assertEqual(calls["scanned"][-1], 300)
+        self.assertEqual(calls["total"][-1], 300)
+        self.assertEqual(calls["hash"][-1], (dup_finder_obj.bytes_hashed, dup_finder_obj.bytes_to_hash))
+        self.assertEqual(len(dup_finder_obj.dup_groups), 100)
+
+    def test_image_exts_from_ext_list(self):
+        dup_finder_obj = DuplicateFinder()
+        dup_finder_obj._check_image_mode()
+        self.assertTrue(is_image_path("photo.JPG", dup_finder_obj._image_exts))
+        self.assertFalse(is_image_path("photo.heic", dup_finder_obj._image_exts))
+        dup_finder_obj.add_ext(".HEIC")
+        dup_finder_obj._check_image_mode()
+        self.assertTrue(is_image_path("photo.heic", dup_finder_obj._image_exts))
+        self.assertFalse(is_image_path("photo.jpg", dup_finder_obj._image_exts))
+
+
+
+
+class TestCompare(SearchTestCase):
+    def test_compare_file_list(self):
+        content = os.urandom(10000)
+        file_path_list = [self.write_file(content, "a"), self.write_file(content[:5000] + b"!" + content[5001:], "b"),
+                          self.write_file(content, "c"), self.get_path("missing"),
+                          self.write_file(content[:5000] + b"!" + content[5001:], "d"), self.write_file(b"!", "e")]
+        index_lists, bytes_read = compare_file_list(file_path_list, 4096)
+        self.assertEqual(index_lists, [[0, 2], [1, 4], [3], [5]])
+        self.assertEqual(bytes_read, 40001)
+        # files stop being read once they differ from every other file
+        self.assertEqual(compare_file_list(file_path_list[:2], 4096), ([[0], [1]], 4096 * 4))
+
+    def test_search_compares_instead_of_hashing(self):
+        content = os.urandom(20000)
+        for name in ("a", "b", "c"):
+            self.write_file(content, name)
+        self.write_file(content[:-1] + b"!", "d")
+        dup_finder_obj = DuplicateFinder()
+        dup_finder_obj.add_search_dir(self.directory)
+        dup_finder_obj.compare_min_size = 0
+        dup_finder_obj.compare_max_files = 4
+        dup_finder_obj.start_search()
+        self.assertEqual(len(dup_finder_obj.dup_groups), 1)
+        group_id = dup_finder_obj.dup_groups.get_group_ids()[0]
+        self.assertEqual(dup_finder_obj.dup_groups.get_group_key(group_id)[1], "")
+        self.assertEqual(sorted(dup_finder_obj.dup_groups.get_path_lists()[0]),
+                         [self.get_path("a"), self.get_path("b"), self.get_path("c")])
+
+
+class TestIncrementalSearch(SearchTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.snapshot_directory = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.snapshot_directory, "snapshot.json")
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        shutil.rmtree(self.snapshot_directory)
+
+    def test_snapshot_has_every_file(self):
+        self.write_file(b"same", "a", "x")
+        self.write_file(b"same", "a", "b", "y")
+        self.write_file(b"other", "a", "b", "z")
+        self.search(self.snapshot_path)
+        with open(self.snapshot_path, "r", encoding="utf-8") as snapshot_io:
+            snapshot = json.load(snapshot_io)
+        directories = snapshot["directories"]
+        self.assertEqual(sorted(name for name, _ in directories[self.get_path("a", "b")][2]), ["y", "z"])
+        self.assertEqual(directories[self.get_path("a")][1], [self.get_path("a", "b")])
+        self.assertNotIn("duplicate_files", snapshot)
+
+    def test_file_changed_in_unchanged_directory(self):
+        for name in ("x", "y", "z"):
+            self.write_file(b"same", "a", name)
+        self.assertEqual(len(self.search(self.snapshot_path).dup_groups.get_group(0)), 3)
+        dir_mtime_ns = os.stat(self.get_path("a")).st_mtime_ns
+        with open(self.get_path("a", "z"), "ab") as file_io:
+            file_io.write(b"!")
+        os.utime(self.get_path("a"), ns=(dir_mtime_ns, dir_mtime_ns))
+
+        dup_finder_obj = self.search(self.snapshot_path)
+        self.assertEqual(len(dup_finder_obj.files), 3)
+        self.assertEqual(sorted(dup_finder_obj.dup_groups.get_path_lists()[0]),
+                         [self.get_path("a", "x"), self.get_path("a", "y")])
+
+
+class TestDeviceQueue(unittest.TestCase):
+    def test_full_device_doesnt_block_other_devices(self):
+        # jobs are (device, inode), the slow device takes 1 job at a time
+        device_queue = DeviceQueue(2, lambda job: job, lambda device: 1 if device == "hdd" else 4)
+        device_queue.put(("hdd", 2))
+        device_queue.put(("hdd", 1))
+        with self.assertRaises(queue.Full):
+            device_queue.put(("hdd", 3), timeout=0.01)
+        for inode in range(2):
+            device_queue.put(("ssd", inode), timeout=0.01)
+        jobs = [device_queue.get(timeout=0.01) for _ in range(3)]
+        self.assertEqual(jobs, [("hdd", 1), ("ssd", 0), ("ssd", 1)])
+        with self.assertRaises(queue.Empty):
+            device_queue.get(timeout=0.01)
+        device_queue.task_done(("hdd", 1))
+        self.assertEqual(device_queue.get(timeout=0.01), ("hdd", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()